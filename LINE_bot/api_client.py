@@ -0,0 +1,100 @@
+# WETHAP APIのクライアント
+# セッションを使い回してTCP/TLSの接続をキープアライブで再利用する
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+API_BASE_URL = "https://adelppi.duckdns.org"
+# (接続, 読み込み)のタイムアウト秒数
+TIMEOUT = (3.05, 10)
+# 接続失敗・5xxのときの再試行回数と待ち時間の係数(0.5, 1, 2秒...と伸びる)
+RETRIES = 3
+BACKOFF = 0.5
+POOL_SIZE = 10
+
+
+class ApiError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class Info:
+    labID: str
+    date: str
+    numGen: int
+    temperature: float
+    humidity: float
+    pressure: float
+    weather: Optional[str]
+
+    @classmethod
+    def from_json(cls, data):
+        try:
+            return cls(
+                labID=str(data["labID"]),
+                date=str(data["date"]),
+                numGen=int(data["numGen"]),
+                temperature=float(data["temperature"]),
+                humidity=float(data["humidity"]),
+                pressure=float(data["pressure"]),
+                weather=None if data.get("weather") is None else str(data["weather"]),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            raise ApiError(f"unexpected getInfo response: {data!r}") from e
+
+
+class ApiClient:
+    def __init__(self, base_url: str = API_BASE_URL, timeout=TIMEOUT, retries: int = RETRIES, backoff: float = BACKOFF, pool_size: int = POOL_SIZE):
+        """WETHAP APIのクライアント
+        Args:
+            base_url (str): APIのURL
+            timeout (tuple[float, float]): (接続, 読み込み)のタイムアウト秒数
+            retries (int): 接続失敗・5xxのときの再試行回数(GETだけ)
+            backoff (float): 再試行の待ち時間の係数
+            pool_size (int): キープアライブで保持する接続数(同時に処理するスレッド数に合わせる)
+        """
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, path: str, params: dict):
+        try:
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            raise ApiError(f"GET {path} failed: {e}") from e
+        return response
+
+    def is_registered(self, lab_id: str) -> bool:
+        return self.get("/isRegistered/", {"labID": lab_id}).text.strip() == "True"
+
+    def get_info(self, lab_id: str, date, num_gen: int) -> Optional[Info]:
+        # データがないコマはNone
+        response = self.get("/getInfo/", {"labID": lab_id, "date": date.strftime("%Y-%m-%d"), "numGen": num_gen})
+        if response.text.strip() == "NODATA":
+            return None
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise ApiError(f"getInfo returned non-JSON: {response.text[:100]!r}") from e
+        return Info.from_json(data)
+
+    def close(self):
+        self.session.close()
+
+
+# botの全スレッドで共有する
+client = ApiClient()
@@ -1,13 +1,13 @@
 # flask run
 # ngrok http 5000
 
-from flask import Flask, request, abort
+from flask import Flask, request, abort, Response
 
 from linebot import (
-    LineBotApi, WebhookHandler
+    LineBotApi, WebhookParser
 )
 from linebot.exceptions import (
-    InvalidSignatureError
+    InvalidSignatureError, LineBotApiError
 )
 from linebot.models import (
     MessageEvent, TextMessage, TextSendMessage,
@@ -17,20 +17,54 @@ from key import at, sk
 
 import pprint
 import re
-import requests
 from datetime import datetime
-from datetime import date
-from fetch_info import fetchInfo
+from fetch_info import fetchInfo, isRegistered, cacheStats
+from api_client import ApiError
+from event_queue import EventDispatcher
+from session_store import open_store
 
 app = Flask(__name__)
 
 line_bot_api = LineBotApi(at)
-handler = WebhookHandler(sk)
+parser = WebhookParser(sk)
+
+# webhookへの応答を待たせないよう、イベントはワーカーで処理する
+EVENT_WORKERS = 4
+EVENT_QUEUE_SIZE = 250
+BUSY_MESSAGE = "ただいま混み合っています。しばらくしてからもう一度送ってください"
+
+# 会話の途中で放置されたユーザーの状態は30分で消す
+SESSION_TTL = 60 * 30
+SESSION_MAX_SIZE = 10000
 
 @app.route("/", methods=['GET'])
 def test():
     return "Hello"
 
+@app.route("/metrics", methods=['GET'])
+def metrics():
+    # WETHAP APIへの問い合わせキャッシュの状況(Prometheusのテキスト形式)
+    lines = []
+    for name in ("hits", "misses", "expired", "evictions", "size"):
+        kind = "gauge" if name == "size" else "counter"
+        metric = f"wethap_bot_cache_{name}" if name == "size" else f"wethap_bot_cache_{name}_total"
+        lines.append(f"# TYPE {metric} {kind}")
+        for cache, stats in cacheStats().items():
+            lines.append(f'{metric}{{cache="{cache}"}} {stats[name]}')
+
+    # webhookイベントの待ち行列
+    events = dispatcher.stats()
+    lines += ["# TYPE wethap_bot_event_queue_depth gauge", f"wethap_bot_event_queue_depth {events['depth']}"]
+    for name in ("enqueued", "processed", "errors", "dropped"):
+        lines += [f"# TYPE wethap_bot_events_{name}_total counter", f"wethap_bot_events_{name}_total {events[name]}"]
+    for name in ("wait", "processing"):
+        metric = f"wethap_bot_event_{name}_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for quantile, value in (("0.5", events[name]["p50"]), ("0.95", events[name]["p95"])):
+            if value is not None:
+                lines.append(f'{metric}{{quantile="{quantile}"}} {value:.6f}')
+    return Response("\n".join(lines) + "\n", mimetype="text/plain; version=0.0.4")
+
 @app.route("/callback", methods=['POST'])
 def callback():
     # get X-Line-Signature header value
@@ -40,16 +74,34 @@ def callback():
     body = request.get_data(as_text=True)
     app.logger.info("Request body: " + body)
 
-    # handle webhook body
+    # verify signature, then queue events and reply right away
     try:
-        handler.handle(body, signature)
+        events = parser.parse(body, signature)
     except InvalidSignatureError:
         print("Invalid signature. Please check your channel access token/channel secret.")
         abort(400)
 
+    for event in events:
+        # 同じユーザーのイベントは届いた順に処理する
+        if not dispatcher.submit(getattr(event.source, "user_id", None), event):
+            # 待ち行列があふれたイベントは処理できないので、黙って捨てずに混雑していることを返信する
+            # (落とした数はdispatcherが数えていて/metricsのwethap_bot_events_dropped_totalに出る)
+            app.logger.warning(f"event queue is full, dropped {type(event).__name__} from {getattr(event.source, 'user_id', None)}")
+            reply_busy(event)
+
     return 'OK'
 
 
+def reply_busy(event):
+    reply_token = getattr(event, "reply_token", None)
+    if reply_token is None:
+        return
+    try:
+        line_bot_api.reply_message(reply_token,TextSendMessage(BUSY_MESSAGE))
+    except LineBotApiError as e:
+        app.logger.warning(f"busy reply failed: {e}")
+
+
 # set situation
 STATE_INITIAL = 0
 STATE_LOCATION_RECEIVED = 1
@@ -88,9 +140,15 @@ def initial_state(event):
 # process after submitted location
 def location_received_state(event, location):
 
-    isRegistered = requests.get(f"https://adelppi.duckdns.org/isRegistered/?labID={location}").text
+    try:
+        registered = isRegistered(location)
+    except ApiError as e:
+        print(e)
+        text = "WETHAPに接続できませんでした。時間をおいてもう一度入力してください。"
+        line_bot_api.reply_message(event.reply_token,TextSendMessage(text))
+        return
 
-    if isRegistered == "True":
+    if registered:
         update_id_dict(event.source.user_id,state = STATE_DATE_RECEIVED,location = location)
 
 
@@ -103,43 +161,38 @@ def location_received_state(event, location):
         line_bot_api.reply_message(event.reply_token,TextSendMessage(text))
 
 
-id_dict = {}
+# user_id -> {"state", "location", "date"}
+# LINE_BOT_SESSION_STORE=sqliteにすると複数のワーカープロセスで共有できる
+sessions = open_store("conversation", ttl=SESSION_TTL, max_size=SESSION_MAX_SIZE)
 
 def update_id_dict(id,**update_data):
-    if id in id_dict.keys():
-        for key, value in update_data.items():
-            id_dict[id][key] = value
-    else:
+    if not sessions.update(id,**update_data):
         print(f"{id} not found")
 
 def delete_data(id):
-    if id in id_dict.keys():
-        del id_dict[id]
-    else:
+    if not sessions.delete(id):
         print(f"{id} not found")
 
 def add_data(id,**new_data):
-    if id in id_dict.keys():
+    if not sessions.add(id,**new_data):
         print(f"{id} already exists")
-    else:
-        id_dict[id] = new_data
 
 
 # every week send
-every_week_dict = {}
+every_week_users = open_store("every_week", max_size=SESSION_MAX_SIZE)
 def register_id(id,**new_data):
-    if id in every_week_dict.keys():
+    if not every_week_users.add(id,**new_data):
         print(f"{id} already exists")
-    else:
-        every_week_dict[id] = new_data
 
+def handle_event(event):
+    if isinstance(event, MessageEvent) and isinstance(event.message, TextMessage):
+        handle_message(event)
 
-state = STATE_INITIAL
-location = ""
 
-@handler.add(MessageEvent,message=TextMessage)
 def handle_message(event):
-    global state, location, date, num_gen
+    # 複数のワーカーから呼ばれるので、location, date, num_genはこの関数の中だけで使う
+    session = sessions.get(event.source.user_id)
+    state = STATE_INITIAL if session is None else session["state"]
 
     print(state)
 
@@ -153,14 +206,14 @@ def handle_message(event):
     print(event.source.user_id)
     # print(event)
 
-    print(id_dict)
+    print(session)
 
     if "!登録" in event.message.text:
         register_id(event.source.user_id,)
 
     if "教え" in event.message.text:
         # set inital state and register id
-        if str(event.source.user_id) not in id_dict.keys():
+        if session is None:
             add_data(event.source.user_id,state = STATE_INITIAL,location = "")
 
         # set initial state
@@ -168,13 +221,13 @@ def handle_message(event):
 
 
     # elif id_dict.get(event.source.user_id,dict()).get(state) == STATE_LOCATION_RECEIVED:
-    elif str(event.source.user_id) in id_dict.keys() and id_dict[event.source.user_id]["state"] == STATE_LOCATION_RECEIVED:
+    elif session is not None and state == STATE_LOCATION_RECEIVED:
         # get location
         location = event.message.text
         location_received_state(event, location)
 
     # elif state == STATE_DATE_RECEIVED:
-    elif str(event.source.user_id) in id_dict.keys() and id_dict[event.source.user_id]["state"] == STATE_DATE_RECEIVED:
+    elif session is not None and state == STATE_DATE_RECEIVED:
         try :
             # get day
             if "月" in event.message.text and "日" in event.message.text and "限" in event.message.text:
@@ -188,7 +241,7 @@ def handle_message(event):
 
                 print(date)
                 endtime = datetime.strptime(endTime[num_gen],"%H:%M").time()
-                update_id_dict(event.source.user_id,date = date)
+                update_id_dict(event.source.user_id,date = date.isoformat())
 
 
                 if 1 > num_gen < 12:
@@ -215,25 +268,32 @@ def handle_message(event):
                         # if 3 >= now.month >= 1 and 12 >= date.month >= 4:
                         #     date.replace(year =  now.year - 1)
 
-                        location = str(id_dict[event.source.user_id]["location"])
+                        location = str(session["location"])
                         print(location)
                         info = fetchInfo(location, date, num_gen)
-                        T = info["temperature"]
-                        H = info["humidity"]
-                        AP = info["pressure"]
-                        WE = info["weather"]
-                        text = (f"{date.year}年{text}の{location}の情報は以下の通りです\n気温 : {T}℃\n湿度 : {H}%\n気圧 : {AP}hPa\n天気 : {WE}")
+                        if info is None:
+                            text = f"{date.year}年{text}の{location}のデータはありません。"
+                        else:
+                            T = info.temperature
+                            H = info.humidity
+                            AP = info.pressure
+                            WE = info.weather
+                            text = (f"{date.year}年{text}の{location}の情報は以下の通りです\n気温 : {T}℃\n湿度 : {H}%\n気圧 : {AP}hPa\n天気 : {WE}")
                         line_bot_api.reply_message(event.reply_token,TextSendMessage(text))
 
                         # set initial state
                         delete_data(event.source.user_id)
-                        print(id_dict)
 
 
             else :
                 text = "正しく入力又は半角数字でしてください。あ"
                 line_bot_api.reply_message(event.reply_token,TextSendMessage(text))
 
+        except ApiError as e:
+            print(e)
+            text = "WETHAPに接続できませんでした。時間をおいてもう一度入力してください。"
+            line_bot_api.reply_message(event.reply_token,TextSendMessage(text))
+
         except Exception as e:
             print(e)
             text = "正しく入力又は半角数字でしてください。"
@@ -246,5 +306,9 @@ def handle_message(event):
         line_bot_api.reply_message(event.reply_token,TextSendMessage(text))
 
 
+dispatcher = EventDispatcher(handle_event, workers=EVENT_WORKERS, max_queue=EVENT_QUEUE_SIZE)
+dispatcher.start()
+
+
 if __name__ == "__main__":
     app.run()
\ No newline at end of file
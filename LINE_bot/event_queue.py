@@ -0,0 +1,84 @@
+import collections
+import queue
+import threading
+import time
+import zlib
+
+
+class EventDispatcher:
+    def __init__(self, handle, workers: int = 4, max_queue: int = 250):
+        """Webhookのイベントをワーカースレッドで処理する
+        同じユーザーのイベントは必ず同じワーカーに渡すので、届いた順に1つずつ処理される
+        Args:
+            handle (Callable[[Event], None]): イベントを処理する関数
+            workers (int): ワーカースレッド数
+            max_queue (int): ワーカー1本あたりの待ち行列の最大長、あふれた分は捨てる
+        """
+        self.handle = handle
+        self.queues = [queue.Queue(maxsize=max_queue) for _ in range(workers)]
+        self.threads = []
+        self.lock = threading.Lock()
+        self.counters = {"enqueued": 0, "processed": 0, "errors": 0, "dropped": 0}
+        # (待ち時間, 処理時間)の直近の記録
+        self.latencies = collections.deque(maxlen=1000)
+
+    def start(self):
+        for i, events in enumerate(self.queues):
+            thread = threading.Thread(target=self.run, args=(events,), name=f"event-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self, timeout: float = 10.0):
+        # 積まれているイベントを処理し終えてから止まる
+        for events in self.queues:
+            events.put(None)
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def submit(self, key: str, event):
+        # keyはユーザーID、待ち行列があふれていればFalse
+        events = self.queues[zlib.crc32(str(key).encode()) % len(self.queues)]
+        try:
+            events.put_nowait((event, time.monotonic()))
+        except queue.Full:
+            with self.lock:
+                self.counters["dropped"] += 1
+            return False
+        with self.lock:
+            self.counters["enqueued"] += 1
+        return True
+
+    def run(self, events: queue.Queue):
+        while True:
+            item = events.get()
+            if item is None:
+                return
+            event, enqueued_at = item
+            start = time.monotonic()
+            try:
+                self.handle(event)
+                failed = False
+            except Exception as e:
+                print(f"event handling failed: {e}")
+                failed = True
+            end = time.monotonic()
+            with self.lock:
+                self.counters["errors" if failed else "processed"] += 1
+                self.latencies.append((start - enqueued_at, end - start))
+
+    def depth(self):
+        return sum(events.qsize() for events in self.queues)
+
+    def stats(self):
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+        with self.lock:
+            stats = dict(self.counters)
+            waits = sorted(latency[0] for latency in self.latencies)
+            runs = sorted(latency[1] for latency in self.latencies)
+        stats["depth"] = self.depth()
+        stats["wait"] = {"p50": percentile(waits, 0.5), "p95": percentile(waits, 0.95)}
+        stats["processing"] = {"p50": percentile(runs, 0.5), "p95": percentile(runs, 0.95)}
+        return stats
@@ -1,22 +1,73 @@
-import requests
-import json
+import os
 from datetime import datetime
 from datetime import date
+import api_client
+from result_cache import ResultCache
+
+# http: WETHAP APIにHTTPSで問い合わせる
+# local: 同じマシンのdata.dbを直接読む(WETHAP_DB_PATH, WETHAP_API_DIRで場所を指定できる)
+DATA_BACKEND = os.environ.get("LINE_BOT_DATA_BACKEND", "http")
+
+# 問い合わせ結果のキャッシュ
+# 前日以前で天気まで埋まったコマは変わらないので長く、それ以外(データなしを含む)は短く持つ
+PAST_TTL = 60 * 60 * 24 * 30
+RECENT_TTL = 60
+# 登録済みの研究室は長く、未登録はすぐ登録されるかもしれないので短く覚える
+REGISTERED_TTL = 60 * 60
+UNREGISTERED_TTL = 60
+CACHE_SIZE = 1024
+
+info_cache = ResultCache(CACHE_SIZE)
+registered_cache = ResultCache(CACHE_SIZE)
+
+MISSING = object()
+
+
+def openClient(backend=DATA_BACKEND):
+    if backend == "http":
+        return api_client.client
+    if backend == "local":
+        from local_client import LocalClient
+        return LocalClient()
+    raise ValueError(f"unknown data backend: {backend}")
+
+
+client = openClient()
+
+
+def isRegistered(location):
+    registered = registered_cache.get(location)
+    if registered is not None:
+        return registered
+
+    registered = client.is_registered(location)
+    registered_cache.put(location, registered, REGISTERED_TTL if registered else UNREGISTERED_TTL)
+    return registered
 
-API_BASE_URL = "https://adelppi.duckdns.org/getInfo"
 
-# dateをyyyy/mm/ddの形で渡してdate.year,date.month,date.dayで分ける方がいい？
 def fetchInfo(location, date, num_gen):
-    inputURL = f"{API_BASE_URL}/?labID={location}&date={date.year}-{date.month}-{date.day}&numGen={num_gen}"
-    print(inputURL)
-    response = requests.get(inputURL)
-    fetchedData = json.loads(response.text)
+    """そのコマのデータ(api_client.Info)を返す、データがなければNone
+    Raises:
+        api_client.ApiError: APIに問い合わせられなかったとき
+    """
+    key = (location, date.isoformat(), num_gen)
+    info = info_cache.get(key, MISSING)
+    if info is not MISSING:
+        return info
+
+    info = client.get_info(location, date, num_gen)
+    final = info is not None and info.weather is not None and date < datetime.now().date()
+    info_cache.put(key, info, PAST_TTL if final else RECENT_TTL)
+    return info
+
+
+def cacheStats():
+    return {"isRegistered": registered_cache.stats(), "fetchInfo": info_cache.stats()}
 
-    return fetchedData
 
 if __name__ == "__main__":
     date = date(2023,4,3)
     print(date)
-    infoDict= fetchInfo("下沢家", date , 1)
+    info = fetchInfo("下沢家", date , 1)
 
-    print(infoDict)
\ No newline at end of file
+    print(info)
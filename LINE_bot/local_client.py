@@ -0,0 +1,58 @@
+# WETHAP APIと同じマシンで動かすとき、HTTPを通さずdata.dbを直接読むクライアント
+# ApiClientと同じメソッドを持つので、fetch_info.pyから差し替えて使える
+import os
+import sqlite3
+import sys
+from typing import Optional
+
+from api_client import ApiError, Info
+
+WETHAP_API_DIR = os.environ.get("WETHAP_API_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "WETHAP_API"))
+WETHAP_DB_PATH = os.environ.get("WETHAP_DB_PATH", os.path.join(WETHAP_API_DIR, "data.db"))
+POOL_SIZE = 10
+
+FIELDS = ("labID", "date", "numGen", "temperature", "humidity", "pressure", "weather")
+
+
+class LocalClient:
+    def __init__(self, db_path: str = WETHAP_DB_PATH, api_dir: str = WETHAP_API_DIR, pool_size: int = POOL_SIZE):
+        """data.dbを読み込み専用で開き、WETHAP_APIのDBCommandsで問い合わせる
+        Args:
+            db_path (str): WETHAP APIのDBファイルのパス(スキーマの更新はAPI側で済ませておく)
+            api_dir (str): WETHAP_APIのディレクトリ(DBManageをここからimportする)
+            pool_size (int): 保持するコネクション数(同時に処理するスレッド数に合わせる)
+        """
+        api_dir = os.path.abspath(api_dir)
+        if api_dir not in sys.path:
+            sys.path.append(api_dir)
+        from DBManage import DBCommands
+        from DBPool import ConnectionPool
+
+        self.DBCommands = DBCommands
+        self.db_path = db_path
+        self.pool = ConnectionPool(db_path, size=pool_size, readOnly=True)
+
+    def query(self, method: str, **kwargs):
+        try:
+            db = self.DBCommands(DB_PATH=self.db_path, pool=self.pool)
+        except (sqlite3.Error, TimeoutError) as e:
+            raise ApiError(f"cannot open {self.db_path}: {e}") from e
+        try:
+            return getattr(db, method)(**kwargs)
+        except sqlite3.Error as e:
+            raise ApiError(f"{method} failed: {e}") from e
+        finally:
+            db.close()
+
+    def is_registered(self, lab_id: str) -> bool:
+        return self.query("isRegistered", labID=lab_id)
+
+    def get_info(self, lab_id: str, date, num_gen: int) -> Optional[Info]:
+        # データがないコマはNone
+        row = self.query("select", labID=lab_id, date=date.strftime("%Y-%m-%d"), numGen=num_gen)
+        if row is None:
+            return None
+        return Info.from_json(dict(zip(FIELDS, row)))
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,48 @@
+import collections
+import threading
+import time
+
+
+class ResultCache:
+    def __init__(self, max_size: int = 1024):
+        """有効期限つきのLRUキャッシュ(WETHAP APIへの問い合わせ結果を保持する)
+        Args:
+            max_size (int): 保持する最大件数、超えると最も古く使われたものから捨てる
+        """
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return default
+            if entry[1] <= time.monotonic():
+                del self.entries[key]
+                self.counters["expired"] += 1
+                self.counters["misses"] += 1
+                return default
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+
+    def put(self, key, value, ttl: float):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.entries)
+        return stats
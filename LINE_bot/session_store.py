@@ -0,0 +1,201 @@
+# ユーザーごとの会話の状態を保持するストア
+#   MemorySessionStore: プロセス内(ワーカー1プロセスのとき)
+#   SQLiteSessionStore: SQLiteファイル(複数プロセスで共有、再起動しても残る)
+# どちらも最後に書き込んでからttl秒で消え、max_size件を超えると最も前に書き込まれたものから消える
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SESSION_STORE = os.environ.get("LINE_BOT_SESSION_STORE", "memory")
+SESSION_DB_PATH = os.environ.get("LINE_BOT_SESSION_DB", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sessions.db"))
+
+
+class MemorySessionStore:
+    def __init__(self, ttl: float = None, max_size: int = 10000):
+        """有効期限と上限つきの辞書
+        Args:
+            ttl (float): 最後に書き込んでから消えるまでの秒数(Noneなら期限なし)
+            max_size (int): 保持する最大件数
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        # key -> (data, expires_at)、書き込んだ順(期限の早い順)に並ぶ
+        self.entries = collections.OrderedDict()
+
+    def _expires_at(self):
+        return None if self.ttl is None else time.monotonic() + self.ttl
+
+    def _live(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.entries[key]
+            return None
+        return entry
+
+    def _sweep(self):
+        # 期限切れは先頭に溜まるので、先頭から見ていけばよい
+        now = time.monotonic()
+        while self.entries:
+            expires_at = next(iter(self.entries.values()))[1]
+            if expires_at is None or expires_at > now:
+                break
+            self.entries.popitem(last=False)
+
+    def get(self, key):
+        with self.lock:
+            entry = self._live(key)
+            return None if entry is None else dict(entry[0])
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def add(self, key, **data):
+        # 既にあれば何もせずFalse
+        with self.lock:
+            if self._live(key) is not None:
+                return False
+            self.entries[key] = (data, self._expires_at())
+            self._sweep()
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+            return True
+
+    def update(self, key, **data):
+        # なければ何もせずFalse
+        with self.lock:
+            entry = self._live(key)
+            if entry is None:
+                return False
+            self.entries[key] = ({**entry[0], **data}, self._expires_at())
+            self.entries.move_to_end(key)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            return self.entries.pop(key, None) is not None
+
+    def __len__(self):
+        with self.lock:
+            return len(self.entries)
+
+
+class SQLiteSessionStore:
+    def __init__(self, path: str, name: str, ttl: float = None, max_size: int = 10000, prune_every: int = 100):
+        """SQLiteファイルに置くストア、nameごとに別の表になる
+        Args:
+            path (str): DBファイルのパス
+            name (str): 表の名前
+            ttl (float): 最後に書き込んでから消えるまでの秒数(Noneなら期限なし)
+            max_size (int): 保持する最大件数
+            prune_every (int): 何回書き込むごとに期限切れと上限超えを掃除するか
+        """
+        self.path = path
+        self.table = f"session_{name}"
+        self.ttl = ttl
+        self.max_size = max_size
+        self.prune_every = prune_every
+        self.writes = 0
+        self.local = threading.local()
+        connection = self._connection()
+        with connection:
+            # 期限はプロセスをまたぐのでUNIX時間で持つ
+            connection.execute(f"CREATE TABLE IF NOT EXISTS {self.table}(key TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL, touched_at REAL NOT NULL) WITHOUT ROWID")
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_touched_at ON {self.table}(touched_at)")
+
+    def _connection(self):
+        # スレッドごとにコネクションを持つ
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode = WAL")
+            connection.execute("PRAGMA synchronous = NORMAL")
+            self.local.connection = connection
+        return connection
+
+    def _expires_at(self, now):
+        return None if self.ttl is None else now + self.ttl
+
+    def _read(self, connection, key, now):
+        row = connection.execute(f"SELECT data FROM {self.table} WHERE key = ? and (expires_at IS NULL or expires_at > ?)", (key, now)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _write(self, connection, key, data, now):
+        connection.execute(
+            f"INSERT OR REPLACE INTO {self.table} VALUES(?, ?, ?, ?)",
+            (key, json.dumps(data, ensure_ascii=False), self._expires_at(now), now))
+
+    def _prune(self, connection, now):
+        self.writes += 1
+        if self.writes % self.prune_every:
+            return
+        connection.execute(f"DELETE FROM {self.table} WHERE expires_at <= ?", (now,))
+        connection.execute(
+            f"DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY touched_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_size,))
+
+    def get(self, key):
+        return self._read(self._connection(), key, time.time())
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def add(self, key, **data):
+        connection = self._connection()
+        now = time.time()
+        # 別プロセスと読み書きが入れ違わないよう、書き込みロックを取ってから確認する
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if self._read(connection, key, now) is not None:
+                connection.rollback()
+                return False
+            self._write(connection, key, data, now)
+            self._prune(connection, now)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        return True
+
+    def update(self, key, **data):
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            current = self._read(connection, key, now)
+            if current is None:
+                connection.rollback()
+                return False
+            self._write(connection, key, {**current, **data}, now)
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        return True
+
+    def delete(self, key):
+        return self._connection().execute(f"DELETE FROM {self.table} WHERE key = ?", (key,)).rowcount > 0
+
+    def __len__(self):
+        return self._connection().execute(f"SELECT COUNT(*) FROM {self.table} WHERE expires_at IS NULL or expires_at > ?", (time.time(),)).fetchone()[0]
+
+
+def open_store(name: str, ttl: float = None, max_size: int = 10000, kind: str = SESSION_STORE, path: str = SESSION_DB_PATH):
+    """LINE_BOT_SESSION_STOREで選んだ種類のストアを返す
+    Args:
+        name (str): ストアの名前(SQLiteでは表の名前)
+        ttl (float): 最後に書き込んでから消えるまでの秒数(Noneなら期限なし)
+        max_size (int): 保持する最大件数
+        kind (str): "memory" または "sqlite"
+        path (str): SQLiteのDBファイルのパス
+    """
+    if kind == "memory":
+        return MemorySessionStore(ttl=ttl, max_size=max_size)
+    if kind == "sqlite":
+        return SQLiteSessionStore(path, name, ttl=ttl, max_size=max_size)
+    raise ValueError(f"unknown session store: {kind}")
@@ -42,6 +42,13 @@ TIME_URL: str = "https://worldtimeapi.org/api/ip"
 NTP_URL: str = "ntp.nict.jp"
 FINISH_TIME: tuple[str] = ("09:25", "10:10", "11:10", "11:55", "13:30", "14:15", "15:15", "16:00", "17:00", "17:45", "18:45", "19:30")
 TIMEZONE: int = 9
+# 高頻度モード: SAMPLE_INTERVAL秒ごとの測定値をためてSAMPLE_BATCH件ずつ送る(コマごとの値はサーバーが平均から作る)
+HIGH_FREQUENCY: bool = False
+SAMPLE_URL: str = "https://adelppi.duckdns.org/addSamples"
+SAMPLE_INTERVAL: int = 60
+SAMPLE_BATCH: int = 5
+# 送れない間にためておく最大件数(古いものから捨てる)
+MAX_SAMPLES: int = 180
 
 SSID: str = "************"
 PASSWORD: str = "********"
@@ -91,6 +98,9 @@ is_online = False
 is_post = False
 # 時間更新フラグ
 is_time = False
+# 高頻度モードで送信待ちの測定値
+samples = []
+last_sample = time.ticks_ms()
 
 # wifi初期化
 wlan = network.WLAN(network.STA_IF)
@@ -198,7 +208,31 @@ try:
 
         now_time = f"{hour:02d}:{now[5]:02d}"
 
-        if is_init and is_online and now_time in FINISH_TIME and not is_post:
+        if HIGH_FREQUENCY and is_init and time.ticks_diff(time.ticks_ms(), last_sample) >= SAMPLE_INTERVAL * 1000:
+            last_sample = time.ticks_ms()
+            # RTCはUTCなのでZをつけて送る
+            samples.append({
+                "ts": f"{now[0]}-{now[1]:02d}-{now[2]:02d}T{now[4]:02d}:{now[5]:02d}:{now[6]:02d}Z",
+                "temperature": f'{envs["temperature"]:.2f}',
+                "humidity": f'{envs["humidity"]:.3f}',
+                "pressure": f'{envs["pressure"]:.2f}',
+            })
+            if len(samples) > MAX_SAMPLES:
+                del samples[:len(samples) - MAX_SAMPLES]
+
+            if is_online and len(samples) >= SAMPLE_BATCH:
+                data = {"labID": LAB_ID, "sensor": type(collector.sensor).__name__, "samples": samples}
+                try:
+                    response = urequests.post(SAMPLE_URL, data=json.dumps(data).encode("unicode_escape"), headers={"Content-Type": "application/json"})
+                except:
+                    print("sample post failed")
+                else:
+                    print(f"samples: {response.status_code}")
+                    if response.status_code in (200, 202):
+                        samples = []
+                    response.close()
+
+        if not HIGH_FREQUENCY and is_init and is_online and now_time in FINISH_TIME and not is_post:
             data:dict[str, str|int] = {
                 "labID": LAB_ID,
                 "date": f"{now[0]}-{now[1]:02d}-{day:02d}",
@@ -206,6 +240,7 @@ try:
                 "temperature": f'{envs["temperature"]:.2f}',
                 "humidity": f'{envs["humidity"]:.3f}',
                 "pressure": f'{envs["pressure"]:.2f}',
+                "sensor": type(collector.sensor).__name__,
             }
 
             led.off()
@@ -220,7 +255,8 @@ try:
                 print(response.status_code)
                 print(response.content)
 
-                if response.status_code == 200:
+                # 天気は後からサーバー側で埋めるので202も成功扱い
+                if response.status_code in (200, 202):
                     is_post = True
                     display.add_text("post:success", new=True).line()
                     display.add_text(f'date:{data["date"]}')
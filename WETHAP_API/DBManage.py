@@ -1,14 +1,55 @@
+import compactStore
+import inspect
+import labCache
+import metrics
+import rollup
 import sqlite3
+from compactStore import COLUMNS, LAB_ID, SAMPLE_COLUMNS, SOURCE, WEATHER_ID
+from DBMigrate import migrate
+from DBPool import readOnlyUri
+
+# よく使うSQL、文字列を使い回すことでsqlite3のステートメントキャッシュに載る
+# データの実体はreadings(compactStore.py)なので、パラメーターはcompactStore.encode/encodeKeyしたものを渡す
+INSERT_INFO = f"INSERT OR REPLACE INTO readings VALUES({LAB_ID}, ?, ?, ?, ?, ?, {WEATHER_ID})"
+SELECT_INFO = f"SELECT {COLUMNS} FROM {SOURCE} WHERE readings.lab = {LAB_ID} and readings.day = ? and readings.numGen = ?"
+# existingKeysで1回に問い合わせるキーの数(パラメーターは3倍、SQLITE_MAX_VARIABLE_NUMBERの古い既定値999に収める)
+EXISTS_BATCH = 300
+EXISTS_LAB = "SELECT 1 FROM labs WHERE labID = ?"
+ADD_WEATHER = "INSERT OR IGNORE INTO weathers(weather) VALUES(?)"
+INSERT_SAMPLE = f"INSERT OR REPLACE INTO samples VALUES({LAB_ID}, ?, ?, ?, ?)"
 
 class DBCommands:
-    def __init__(self, DB_PATH):
+    def __init__(self, DB_PATH, pool = None, cachedStatements: int = 256, readOnly: bool = False):
         self.DB_PATH = DB_PATH
-        self.connection = sqlite3.connect(self.DB_PATH)
+        self.pool = pool
+        # プールが渡された場合はそこからコネクションを借りる
+        if self.pool is not None:
+            self.connection = self.pool.acquire()
+        elif readOnly:
+            # 他のプロセス(LINE botなど)から読むだけのとき、createDBも含めて書き込めない
+            self.connection = sqlite3.connect(readOnlyUri(self.DB_PATH), uri = True, cached_statements = cachedStatements)
+        else:
+            self.connection = sqlite3.connect(self.DB_PATH, cached_statements = cachedStatements)
         self.cursor = self.connection.cursor()
+        self.labs = labCache.cacheFor(self.DB_PATH)
+        self.addedLabs = set()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, excType, exc, traceback):
+        # 例外で抜けたときは書きかけを捨ててから返す(プールのコネクションを必ず返すため)
+        if excType is not None:
+            self.connection.rollback()
+            self.addedLabs.clear()
+        self.close()
 
 
     def createDB(self):
-        self.cursor.execute("CREATE TABLE IF NOT EXISTS infos(labID TEXT, date DATE, numGen INTEGER, temperature INTEGER, humidity INTEGER, pressure INTEGER, weather TEXT)")
+        # テーブル作成と既存DBのスキーマ更新をまとめて行う
+        return migrate(self.connection)
 
 
     def insert(
@@ -21,7 +62,358 @@ class DBCommands:
         pressure: int,
         weather: str
     ):
-        self.cursor.execute(f"INSERT INTO infos VALUES('{labID}', '{date}', {numGen}, {temperature}, {humidity}, {pressure}, '{weather}')")
+        # weatherがNoneのときはNULL(天気取得待ち)として入れる
+        self.insertMany([(labID, date, numGen, temperature, humidity, pressure, weather)])
+
+
+    def insertMany(self, rows):
+        # rowsは(labID, date, numGen, temperature, humidity, pressure, weather)のタプルの列
+        # closeでまとめて1回だけcommitされる
+        # 間引きで生データを消した日付(rawSince)より前の行は入れない
+        # 入れるとその日の集計(既にdaily_stats/weekly_statsにある)へrollup.applyで二重に足されるため
+        rows = list(rows)
+        since = rollup.rawSince(self.cursor)
+        if since is not None:
+            rows = [row for row in rows if compactStore.toDay(row[1]) >= compactStore.toDay(since)]
+            if not rows:
+                return 0
+        replaced = self.existingKeys(tuple(row[:3]) for row in rows)
+        # 研究室と天気の番号を先に用意しておく
+        self.touchLabs(rows)
+        self.cursor.executemany(ADD_WEATHER, [(weather,) for weather in {row[6] for row in rows} if weather is not None])
+        self.cursor.executemany(INSERT_INFO, [compactStore.encode(row) for row in rows])
+        inserted = self.cursor.rowcount
+
+        # 同じ挿入の中で2回出てきたものも上書き扱い
+        seen = set()
+        for row in rows:
+            key = tuple(row[:3])
+            if key in seen:
+                replaced.add(key)
+            seen.add(key)
+        rollup.apply(self.cursor, rows, replaced)
+        return inserted
+
+
+    def insertSamples(self, samples):
+        # samplesは(labID, date, ts, temperature, humidity, pressure)のタプルの列
+        samples = list(samples)
+        self.touchLabs(samples)
+        self.cursor.executemany(INSERT_SAMPLE, [compactStore.encodeSample((sample[0], *sample[2:])) for sample in samples])
+        return self.cursor.rowcount
+
+
+    def derivePeriod(
+        self,
+        labID: str,
+        date: str,
+        numGen: int,
+        start: int,
+        end: int,
+        force: bool = True
+    ):
+        """コマの時間帯(start < ts <= end)のsamplesの平均からinfosの1行を作る(挿入はしない)
+        Args:
+            force (bool): Falseなら既に行があるコマは作らない
+        Returns:
+            tuple: infosの1行、samplesがない(またはforce=Falseで既にある)ときはNone
+        """
+        existing = self.select(date = date, labID = labID, numGen = numGen)
+        if existing is not None and not force:
+            return None
+        # 気圧センサーがなく-1ばかりのときは-1のままにする
+        self.cursor.execute(
+            f"""
+            SELECT COUNT(*), AVG(temperature) / {float(compactStore.SCALE["temperature"])}, AVG(humidity) / {float(compactStore.SCALE["humidity"])},
+                COALESCE(AVG(NULLIF(pressure, -{compactStore.SCALE["pressure"]})), MIN(pressure)) / {float(compactStore.SCALE["pressure"])}
+            FROM samples WHERE lab = {LAB_ID} and ts > ? and ts <= ?
+            """,
+            (labID, start, end))
+        count, temperature, humidity, pressure = self.cursor.fetchone()
+        if not count:
+            return None
+        # 天気は既に埋まっていれば引き継ぐ
+        weather = existing[6] if existing is not None else None
+        return (labID, date, numGen, temperature, humidity, pressure, weather)
+
+
+    def touchLabs(self, rows):
+        # labsに研究室を登録し、最初と最後にデータが来た日付を更新する
+        seen = {}
+        for row in rows:
+            labID, date = row[0], row[1]
+            first, last = seen.get(labID, (date, date))
+            seen[labID] = (min(first, date), max(last, date))
+        self.cursor.executemany(
+            "INSERT INTO labs(labID, firstSeen, lastSeen) VALUES(?, ?, ?) ON CONFLICT(labID) DO UPDATE SET firstSeen = MIN(firstSeen, excluded.firstSeen), lastSeen = MAX(lastSeen, excluded.lastSeen)",
+            [(labID, first, last) for labID, (first, last) in seen.items()])
+        # キャッシュへの反映はcommit後(close)に行う
+        self.addedLabs.update(seen)
+
+
+    def registerLab(
+        self,
+        labID: str,
+        sensor: str
+    ):
+        self.cursor.execute("UPDATE labs SET sensor = ? WHERE labID = ?", (sensor, labID))
+
+
+    def labInfos(self):
+        self.cursor.execute("SELECT labID, sensor, firstSeen, lastSeen FROM labs ORDER BY labID")
+        return self.cursor.fetchall()
+
+
+    def loadLabs(self):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute("SELECT labID FROM labs")
+            return [i[0] for i in cursor.fetchall()]
+        finally:
+            cursor.close()
+
+
+    def existingKeys(self, keys):
+        # 既にreadingsにあるキーを返す、EXISTS_BATCH件ずつまとめて1回のSELECTで調べる
+        encoded = {}
+        for key in keys:
+            encoded.setdefault(compactStore.encodeKey(key), key)
+        pending = list(encoded)
+        existing = set()
+        for i in range(0, len(pending), EXISTS_BATCH):
+            batch = pending[i:i + EXISTS_BATCH]
+            self.cursor.execute(
+                f"""
+                WITH keys(labID, day, numGen) AS (VALUES {', '.join(['(?, ?, ?)'] * len(batch))})
+                SELECT keys.labID, keys.day, keys.numGen
+                FROM keys JOIN labs ON labs.labID = keys.labID
+                JOIN readings ON readings.lab = labs.id and readings.day = keys.day and readings.numGen = keys.numGen
+                """,
+                [value for key in batch for value in key])
+            existing.update(encoded[tuple(row)] for row in self.cursor.fetchall())
+        return existing
+
+
+    def rawSince(self):
+        # 間引きで生データを消した境目の日付、消していなければNone
+        return rollup.rawSince(self.cursor)
+
+
+    def rebuildStats(self):
+        rollup.rebuild(self.cursor, since = rollup.rawSince(self.cursor))
+
+
+    def dailyStats(
+        self,
+        labID: str,
+        dateFrom: str,
+        dateTo: str
+    ):
+        self.cursor.execute(
+            "SELECT * FROM daily_stats WHERE labID = ? and date BETWEEN ? AND ? ORDER BY date",
+            (labID, dateFrom, dateTo))
+        return self.cursor.fetchall()
+
+
+    def periodStats(
+        self,
+        labID: str,
+        term: str
+    ):
+        self.cursor.execute(
+            "SELECT * FROM period_stats WHERE labID = ? and term = ? ORDER BY numGen",
+            (labID, term))
+        return self.cursor.fetchall()
+
+
+    def weeklyStats(
+        self,
+        labID: str,
+        dateFrom: str,
+        dateTo: str
+    ):
+        # 週ごとの集計、weekly_statsに畳んだ分とまだdaily_statsにある分を合わせる
+        self.cursor.execute(
+            f"""
+            SELECT labID, week, {rollup.mergeColumns()}
+            FROM (
+                SELECT * FROM weekly_stats WHERE labID = ? and week BETWEEN {rollup.weekOf("?")} AND ?
+                UNION ALL
+                SELECT labID, {rollup.weekOf("date")}, rows, {', '.join(rollup.COLUMNS)} FROM daily_stats WHERE labID = ? and date BETWEEN {rollup.weekOf("?")} AND ?
+            )
+            GROUP BY week ORDER BY week
+            """,
+            (labID, dateFrom, dateTo, labID, dateFrom, dateTo))
+        return self.cursor.fetchall()
+
+
+    def deleteReadingsBefore(
+        self,
+        date: str,
+        limit: int
+    ):
+        # dateより前の生データをlimit件まで消す(日付の古い順)
+        self.cursor.execute(
+            "DELETE FROM readings WHERE (lab, day, numGen) IN (SELECT lab, day, numGen FROM readings WHERE day < ? ORDER BY day LIMIT ?)",
+            (compactStore.toDay(date), limit))
+        return self.cursor.rowcount
+
+
+    def deleteSamplesBefore(
+        self,
+        ts: int,
+        limit: int
+    ):
+        # tsより前の高頻度の測定値をlimit件まで消す、コマごとの行(readings)は残る
+        # 主キー(lab, ts)の範囲で消せるよう研究室ごとに消す
+        self.cursor.execute("SELECT id FROM labs ORDER BY id")
+        deleted = 0
+        for (lab,) in self.cursor.fetchall():
+            self.cursor.execute(
+                "DELETE FROM samples WHERE lab = ? and ts IN (SELECT ts FROM samples WHERE lab = ? and ts < ? ORDER BY ts LIMIT ?)",
+                (lab, lab, ts, limit - deleted))
+            deleted += self.cursor.rowcount
+            if deleted >= limit:
+                break
+        return deleted
+
+
+    def foldDailyStats(
+        self,
+        date: str,
+        limit: int
+    ):
+        # dateより前の日ごとの集計をlimit件までweekly_statsに足し込んで消す
+        batch = "(labID, date) IN (SELECT labID, date FROM daily_stats WHERE date < ? ORDER BY date, labID LIMIT ?)"
+        self.cursor.execute(
+            rollup.upsertSql(
+                "weekly_stats",
+                ("labID", "week"),
+                f"SELECT labID, {rollup.weekOf('date')}, {rollup.mergeColumns()} FROM daily_stats WHERE {batch} GROUP BY 1, 2"),
+            (date, limit))
+        self.cursor.execute(f"DELETE FROM daily_stats WHERE {batch}", (date, limit))
+        return self.cursor.rowcount
+
+
+    def deleteWeeklyStatsBefore(
+        self,
+        date: str,
+        limit: int
+    ):
+        self.cursor.execute(
+            "DELETE FROM weekly_stats WHERE (labID, week) IN (SELECT labID, week FROM weekly_stats WHERE week < ? ORDER BY week, labID LIMIT ?)",
+            (date, limit))
+        return self.cursor.rowcount
+
+
+    def setRetentionCutoff(
+        self,
+        name: str,
+        date: str
+    ):
+        self.cursor.execute(
+            "INSERT INTO retention_state VALUES(?, ?) ON CONFLICT(name) DO UPDATE SET cutoff = MAX(cutoff, excluded.cutoff)",
+            (name, date))
+
+
+    def incrementalVacuum(self, pages: int):
+        # auto_vacuum = INCREMENTALのDBで空きページを最大pagesページ返す、それ以外のDBでは何もしない
+        self.cursor.execute("PRAGMA auto_vacuum")
+        if self.cursor.fetchone()[0] != 2:
+            return 0
+        self.cursor.execute("PRAGMA freelist_count")
+        before = self.cursor.fetchone()[0]
+        self.cursor.execute(f"PRAGMA incremental_vacuum({int(pages)})")
+        self.cursor.fetchall()
+        self.cursor.execute("PRAGMA freelist_count")
+        return before - self.cursor.fetchone()[0]
+
+
+    def enqueueWeather(
+        self,
+        labID: str,
+        date: str,
+        numGen: int,
+        now: float
+    ):
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO weather_jobs(labID, date, numGen, attempts, nextAttemptAt, createdAt) VALUES(?, ?, ?, 0, ?, ?)",
+            (labID, date, numGen, now, now))
+
+
+    def enqueueWeatherMany(
+        self,
+        keys,
+        now: float
+    ):
+        # keysは(labID, date, numGen)のタプルの列
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO weather_jobs(labID, date, numGen, attempts, nextAttemptAt, createdAt) VALUES(?, ?, ?, 0, ?, ?)",
+            [(*key, now, now) for key in keys])
+
+
+    def claimWeatherJob(
+        self,
+        now: float,
+        lease: float
+    ):
+        # 取り出したジョブはlease秒後まで他のワーカーから見えなくする
+        # 処理中に落ちてもleaseが切れれば再び取り出される
+        if self.connection.in_transaction:
+            self.connection.commit()
+        self.cursor.execute("BEGIN IMMEDIATE")
+        try:
+            self.cursor.execute(
+                "SELECT labID, date, numGen, attempts, createdAt FROM weather_jobs WHERE nextAttemptAt <= ? ORDER BY nextAttemptAt LIMIT 1",
+                (now,))
+            job = self.cursor.fetchone()
+            if job is not None:
+                self.cursor.execute(
+                    "UPDATE weather_jobs SET nextAttemptAt = ? WHERE labID = ? and date = ? and numGen = ?",
+                    (now + lease, job[0], job[1], job[2]))
+            self.connection.commit()
+        except BaseException:
+            self.connection.rollback()
+            raise
+        return job
+
+
+    def completeWeatherJob(
+        self,
+        labID: str,
+        date: str,
+        numGen: int,
+        weather: str
+    ):
+        # weatherがNoneのときは天気をNULLのままにしてジョブだけ消す
+        if weather is not None:
+            self.cursor.execute(ADD_WEATHER, (weather,))
+            self.cursor.execute(
+                f"UPDATE readings SET weather = {WEATHER_ID} WHERE lab = {LAB_ID} and day = ? and numGen = ?",
+                (weather, labID, compactStore.toDay(date), numGen))
+        self.cursor.execute(
+            "DELETE FROM weather_jobs WHERE labID = ? and date = ? and numGen = ?",
+            (labID, date, numGen))
+
+
+    def retryWeatherJob(
+        self,
+        labID: str,
+        date: str,
+        numGen: int,
+        nextAttemptAt: float,
+        error: str
+    ):
+        # nextAttemptAtをNoneにすると以降取り出されなくなる
+        self.cursor.execute(
+            "UPDATE weather_jobs SET attempts = attempts + 1, nextAttemptAt = ?, lastError = ? WHERE labID = ? and date = ? and numGen = ?",
+            (nextAttemptAt, error, labID, date, numGen))
+
+
+    def countWeatherJobs(self):
+        self.cursor.execute("SELECT COUNT(*), COUNT(nextAttemptAt) FROM weather_jobs")
+        total, pending = self.cursor.fetchone()
+        return {"pending": pending, "failed": total - pending}
 
 
     def previewData(self):
@@ -31,24 +423,88 @@ class DBCommands:
         return response
 
 
+    def previewPage(
+        self,
+        limit: int,
+        after: tuple = None,
+        labID: str = None,
+        dateFrom: str = None,
+        dateTo: str = None
+    ):
+        # 日付順(同じ日の中は研究室の番号順)でafter=(date, labID, numGen)より後ろのlimit件を返す(キーセットページング)
+        where, params = self.dataConditions(after = after, labID = labID, dateFrom = dateFrom, dateTo = dateTo)
+        self.cursor.execute(
+            f"SELECT {COLUMNS} FROM {SOURCE} {where} ORDER BY readings.day, readings.lab, readings.numGen LIMIT ?",
+            params + [limit])
+        return self.cursor.fetchall()
+
+
+    def iterData(
+        self,
+        after: tuple = None,
+        chunkSize: int = 500,
+        labID: str = None,
+        dateFrom: str = None,
+        dateTo: str = None
+    ):
+        # 全件(または研究室・期間で絞った分)をchunkSize件ずつ読み出すジェネレーター
+        # メモリ使用量は件数によらないが、読み終わるまでコネクションを使い続ける
+        where, params = self.dataConditions(after = after, labID = labID, dateFrom = dateFrom, dateTo = dateTo)
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f"SELECT {COLUMNS} FROM {SOURCE} {where} ORDER BY readings.day, readings.lab, readings.numGen", params)
+            while True:
+                rows = cursor.fetchmany(chunkSize)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            cursor.close()
+
+
+    def dataConditions(
+        self,
+        after: tuple = None,
+        labID: str = None,
+        dateFrom: str = None,
+        dateTo: str = None
+    ):
+        # previewPageとiterDataのWHERE句とパラメーター
+        conditions = []
+        params = []
+        if after is not None:
+            conditions.append(f"(readings.day, readings.lab, readings.numGen) > (?, {LAB_ID}, ?)")
+            params += [compactStore.toDay(after[0]), after[1], after[2]]
+        if labID is not None:
+            conditions.append(f"readings.lab = {LAB_ID}")
+            params.append(labID)
+        if dateFrom is not None:
+            conditions.append("readings.day >= ?")
+            params.append(compactStore.toDay(dateFrom))
+        if dateTo is not None:
+            conditions.append("readings.day <= ?")
+            params.append(compactStore.toDay(dateTo))
+        where = f"WHERE {' and '.join(conditions)}" if conditions else ""
+        return where, params
+
+
     def isRegistered(
         self,
         labID: str
     ):
-        self.cursor.execute(f"SELECT DISTINCT labID FROM infos WHERE labID = '{labID}'")
-        response = self.cursor.fetchall()
-        
-        if response:
+        if labID in self.labs.get(self.loadLabs):
+            return True
+
+        # 別プロセスで追加されたばかりの研究室かもしれないので主キーで確認する
+        self.cursor.execute(EXISTS_LAB, (labID,))
+        if self.cursor.fetchone() is not None:
+            self.labs.add([labID])
             return True
         else:
             return False
 
     def registeredRooms(self):
-        self.cursor.execute(f"SELECT DISTINCT labID FROM infos")
-        
-        response = self.cursor.fetchall()
-        rooms = [i[0] for i in response]
-        return rooms
+        return sorted(self.labs.get(self.loadLabs))
 
     def select(
         self,
@@ -56,15 +512,99 @@ class DBCommands:
         labID: str,
         numGen: int
     ):
-        self.cursor.execute(f"SELECT * FROM infos WHERE labID = '{labID}' and date = '{date}' and numGen = {numGen}")
+        self.cursor.execute(SELECT_INFO, (labID, compactStore.toDay(date), numGen))
         data = self.cursor.fetchall()
         return data[0] if data else None
 
 
+    def selectRange(
+        self,
+        labID: str,
+        dateFrom: str,
+        dateTo: str
+    ):
+        self.cursor.execute(
+            f"SELECT {COLUMNS} FROM {SOURCE} WHERE readings.lab = {LAB_ID} and readings.day BETWEEN ? AND ? ORDER BY readings.day, readings.numGen",
+            (labID, compactStore.toDay(dateFrom), compactStore.toDay(dateTo)))
+        return self.cursor.fetchall()
+
+
+    def selectSamples(
+        self,
+        labID: str,
+        start: int,
+        end: int,
+        step: int = None
+    ):
+        # start <= ts < end の測定値、stepを指定するとstep秒ごとの平均にする
+        if step is None:
+            self.cursor.execute(
+                f"SELECT {SAMPLE_COLUMNS} FROM samples WHERE lab = {LAB_ID} and ts >= ? and ts < ? ORDER BY ts",
+                (labID, start, end))
+        else:
+            self.cursor.execute(
+                f"""
+                SELECT ts / ? * ? AS bucket, AVG(temperature), AVG(humidity), AVG(pressure)
+                FROM (SELECT {SAMPLE_COLUMNS} FROM samples WHERE lab = {LAB_ID} and ts >= ? and ts < ?)
+                GROUP BY bucket ORDER BY bucket
+                """,
+                (step, step, labID, start, end))
+        return self.cursor.fetchall()
+
+
+    # groupByごとの集計単位、weekは月曜始まりの週の初日
+    BUCKETS = {
+        "day": "date",
+        "week": rollup.weekOf("date"),
+        "numGen": "numGen"
+    }
+
+    def aggregateRange(
+        self,
+        labID: str,
+        dateFrom: str,
+        dateTo: str,
+        groupBy: str
+    ):
+        # 気圧センサーのないDHT11は気圧を-1で送ってくるので集計から外す
+        bucket = self.BUCKETS[groupBy]
+        self.cursor.execute(
+            f"""
+            SELECT {bucket} AS bucket, COUNT(*),
+                MIN(temperature), MAX(temperature), AVG(temperature),
+                MIN(humidity), MAX(humidity), AVG(humidity),
+                MIN(NULLIF(pressure, -1)), MAX(NULLIF(pressure, -1)), AVG(NULLIF(pressure, -1))
+            FROM (
+                SELECT {COLUMNS} FROM {SOURCE}
+                WHERE readings.lab = {LAB_ID} and readings.day BETWEEN ? AND ?
+            )
+            GROUP BY bucket ORDER BY bucket
+            """,
+            (labID, compactStore.toDay(dateFrom), compactStore.toDay(dateTo)))
+        return self.cursor.fetchall()
+
+
     def close(self):
-        self.cursor.close()
-        self.connection.commit()
-        self.connection.close()
+        try:
+            self.cursor.close()
+            self.connection.commit()
+            if self.addedLabs:
+                self.labs.add(self.addedLabs)
+        finally:
+            if self.pool is not None:
+                self.pool.release(self.connection)
+            else:
+                self.connection.close()
+
+
+# 公開メソッドごとの実行時間を記録する(ジェネレーターのiterDataは除く)
+metrics.instrument(
+    DBCommands,
+    metrics.histogram("wethap_db_seconds", "Time spent in DBCommands methods", ("method",)),
+    [
+        name for name, member in vars(DBCommands).items()
+        if inspect.isfunction(member) and not name.startswith("_") and not inspect.isgeneratorfunction(member)
+    ])
 
 
 if __name__ == "__main__":
@@ -83,7 +623,7 @@ if __name__ == "__main__":
     # データを挿入する
     db.insert(
         labID = "テスト研究室",
-        date = "1970-1-1",
+        date = "1970-01-01",
         numGen = 1,
         temperature = 0,
         humidity = 0,
@@ -91,7 +631,7 @@ if __name__ == "__main__":
         weather = "晴れ")
 
     # 条件に合ったデータを、レコードをタプルとした配列で取得
-    print(db.select(labID = "テスト研究室", date = "1970-1-1", numGen = 1))
+    print(db.select(labID = "テスト研究室", date = "1970-01-01", numGen = 1))
 
     # DBの状態を保存、DBの接続を終了する
     db.close()
\ No newline at end of file
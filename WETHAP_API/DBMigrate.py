@@ -0,0 +1,165 @@
+import compactStore
+import rollup
+import sqlite3
+import sys
+from datetime import datetime
+
+
+def normalizeDate(date: str):
+    # dataFormatConverter.pyと同じく"1970-1-1"を"1970-01-01"に揃える
+    try:
+        return datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d")
+    except (TypeError, ValueError):
+        return date
+
+
+def createInfos(cursor: sqlite3.Cursor):
+    # 最初期のスキーマ(DBCommands.createDBで作っていたもの)
+    cursor.execute("CREATE TABLE IF NOT EXISTS infos(labID TEXT, date DATE, numGen INTEGER, temperature INTEGER, humidity INTEGER, pressure INTEGER, weather TEXT)")
+
+
+def indexInfos(cursor: sqlite3.Cursor):
+    cursor.execute("CREATE INDEX IF NOT EXISTS infos_labID_date_numGen ON infos(labID, date, numGen)")
+
+
+def clusterInfos(cursor: sqlite3.Cursor):
+    # (labID, date, numGen)を主キーにしたWITHOUT ROWIDテーブルへ作り直す
+    # 同じコマのデータが複数ある場合は、それまでgetInfoが返していた最初に入ったものを残す
+    # 残らなかった行とキーが欠けた行は消さずにinfos_duplicatesへ移す
+    cursor.execute("CREATE TABLE infos_new(labID TEXT NOT NULL, date TEXT NOT NULL, numGen INTEGER NOT NULL, temperature REAL, humidity REAL, pressure REAL, weather TEXT, PRIMARY KEY (labID, date, numGen)) WITHOUT ROWID")
+    cursor.execute("CREATE TABLE infos_duplicates(sourceRowid INTEGER PRIMARY KEY, labID, date, numGen, temperature, humidity, pressure, weather, archivedAt TEXT NOT NULL)")
+    kept = """
+        rowid IN (
+            SELECT MIN(rowid) FROM infos
+            WHERE labID IS NOT NULL and date IS NOT NULL and numGen IS NOT NULL
+            GROUP BY labID, normalizeDate(date), numGen
+        )
+    """
+    cursor.execute(f"""
+        INSERT INTO infos_duplicates
+        SELECT rowid, labID, date, numGen, temperature, humidity, pressure, weather, datetime('now')
+        FROM infos WHERE NOT {kept}
+    """)
+    archived = cursor.rowcount
+    cursor.execute(f"""
+        INSERT INTO infos_new
+        SELECT labID, normalizeDate(date), numGen, CAST(temperature AS REAL), CAST(humidity AS REAL), CAST(pressure AS REAL), weather
+        FROM infos WHERE {kept}
+    """)
+    if archived:
+        print(f"clusterInfos: moved {archived} duplicate or incomplete rows to infos_duplicates")
+    cursor.execute("DROP TABLE infos")
+    cursor.execute("ALTER TABLE infos_new RENAME TO infos")
+
+
+def createWeatherJobs(cursor: sqlite3.Cursor):
+    # 天気の後付け待ちのキュー、nextAttemptAtがNULLのものは再試行を諦めたもの
+    cursor.execute("CREATE TABLE weather_jobs(labID TEXT NOT NULL, date TEXT NOT NULL, numGen INTEGER NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, nextAttemptAt REAL, createdAt REAL NOT NULL, lastError TEXT, PRIMARY KEY (labID, date, numGen)) WITHOUT ROWID")
+    cursor.execute("CREATE INDEX weather_jobs_nextAttemptAt ON weather_jobs(nextAttemptAt)")
+
+
+def indexInfosByDate(cursor: sqlite3.Cursor):
+    # previewDataのページングで(date, labID, numGen)順に辿るため
+    cursor.execute("CREATE INDEX infos_date_labID_numGen ON infos(date, labID, numGen)")
+
+
+def createRollups(cursor: sqlite3.Cursor):
+    # 日ごと・学期×コマごとの集計表を作り、既存データから埋める
+    rollup.rebuild(cursor)
+
+
+def createLabs(cursor: sqlite3.Cursor):
+    # 研究室の一覧、firstSeen/lastSeenはデータの日付の最初と最後
+    cursor.execute("CREATE TABLE labs(labID TEXT PRIMARY KEY, sensor TEXT, firstSeen TEXT, lastSeen TEXT)")
+    cursor.execute("INSERT INTO labs(labID, firstSeen, lastSeen) SELECT labID, MIN(date), MAX(date) FROM infos GROUP BY labID")
+
+
+def compactInfos(cursor: sqlite3.Cursor):
+    # 研究室・天気を番号に、日付を日数に、測定値を整数にしたreadingsへ移し、infosはビューにする
+    compactStore.createTables(cursor)
+
+
+def createRetentionTables(cursor: sqlite3.Cursor):
+    # 間引き(retention.py)で使うweekly_statsとretention_state
+    rollup.createRetentionTables(cursor)
+
+
+def createSamples(cursor: sqlite3.Cursor):
+    compactStore.createSamples(cursor)
+
+
+def rebuildRollups(cursor: sqlite3.Cursor):
+    # 以前の集計は気温・湿度の-1も値なしとして外していたので、生データが残っている分を作り直す
+    rollup.rebuild(cursor, since = rollup.rawSince(cursor))
+
+
+# (バージョン, 内容, 関数) の順番通りに適用する
+# 一度リリースしたものは書き換えず、変更は末尾に追加すること
+MIGRATIONS = [
+    (1, "create infos", createInfos),
+    (2, "index infos on (labID, date, numGen)", indexInfos),
+    (3, "cluster infos by primary key with REAL measurements", clusterInfos),
+    (4, "create weather_jobs", createWeatherJobs),
+    (5, "index infos on (date, labID, numGen)", indexInfosByDate),
+    (6, "create daily_stats and period_stats", createRollups),
+    (7, "create labs", createLabs),
+    (8, "move infos to compact readings and replace infos with a view", compactInfos),
+    (9, "create weekly_stats and retention_state", createRetentionTables),
+    (10, "create samples", createSamples),
+    (11, "rebuild rollups counting -1 temperature and humidity", rebuildRollups),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def currentVersion(connection: sqlite3.Connection):
+    connection.execute("CREATE TABLE IF NOT EXISTS schema_version(version INTEGER NOT NULL, name TEXT, appliedAt TEXT)")
+    version = connection.execute("SELECT MAX(version) FROM schema_version").fetchone()[0]
+    return version or 0
+
+
+def migrate(connection: sqlite3.Connection, target: int = None):
+    """DBを最新(またはtarget)のスキーマまで更新する
+    Args:
+        connection (sqlite3.Connection): 対象のコネクション
+        target (int): ここまでのバージョンだけ適用する(省略時は最新まで)
+    Returns:
+        list[int]: 今回適用したバージョン
+    """
+    connection.create_function("normalizeDate", 1, normalizeDate, deterministic = True)
+    if connection.in_transaction:
+        connection.commit()
+
+    applied = []
+    for version, name, function in MIGRATIONS:
+        if target is not None and version > target:
+            break
+        # 複数プロセスが同時に起動しても一度だけ適用されるよう、書き込みロックを取ってから確認する
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            if currentVersion(connection) >= version:
+                connection.rollback()
+                continue
+            cursor = connection.cursor()
+            function(cursor)
+            cursor.execute(
+                "INSERT INTO schema_version VALUES(?, ?, ?)",
+                (version, name, datetime.now().isoformat(timespec = "seconds")))
+            cursor.close()
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        applied.append(version)
+
+    return applied
+
+
+if __name__ == "__main__":
+    # python DBMigrate.py ./data.db
+    DB_PATH = sys.argv[1] if len(sys.argv) > 1 else "./data.db"
+    connection = sqlite3.connect(DB_PATH)
+    print(f"before: v{currentVersion(connection)}")
+    print(f"applied: {migrate(connection)}")
+    print(f"after: v{currentVersion(connection)}")
+    connection.close()
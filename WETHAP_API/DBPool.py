@@ -0,0 +1,134 @@
+import os
+import queue
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+
+class PoolClosedError(Exception):
+    pass
+
+
+def readOnlyUri(DB_PATH: str):
+    # 書き込めないように開くためのURI(パスに?や#が入っていてもよいようにエスケープする)
+    return f"file:{pathname2url(os.path.abspath(DB_PATH))}?mode=ro"
+
+
+class ConnectionPool:
+    def __init__(
+        self,
+        DB_PATH: str,
+        size: int = 8,
+        timeout: float = 5.0,
+        cachedStatements: int = 256,
+        wal: bool = True,
+        readOnly: bool = False
+    ):
+        """SQLiteコネクションプール
+        Args:
+            DB_PATH (str): DBファイルのパス
+            size (int): 保持するコネクションの最大数
+            timeout (float): コネクションが空くまで待つ秒数
+            cachedStatements (int): コネクションごとに保持するプリペアドステートメントの数
+            wal (bool): WALモードにするか(読み込みが書き込みを待たなくなる)
+            readOnly (bool): 読み込み専用で開くか(walは無視され、DB側の設定のままになる)
+        """
+        self.DB_PATH = DB_PATH
+        self.size = size
+        self.timeout = timeout
+        self.cachedStatements = cachedStatements
+        self.wal = wal
+        self.readOnly = readOnly
+        self.idle = queue.LifoQueue(maxsize = size)
+        self.slots = threading.BoundedSemaphore(size)
+        self.lock = threading.Lock()
+        self.connections = set()
+        self.closed = False
+
+
+    def connect(self):
+        if self.readOnly:
+            connection = sqlite3.connect(readOnlyUri(self.DB_PATH), uri = True, timeout = self.timeout, check_same_thread = False, cached_statements = self.cachedStatements)
+        else:
+            connection = sqlite3.connect(self.DB_PATH, timeout = self.timeout, check_same_thread = False, cached_statements = self.cachedStatements)
+        if self.wal and not self.readOnly:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+        with self.lock:
+            self.connections.add(connection)
+        return connection
+
+
+    def discard(self, connection: sqlite3.Connection):
+        with self.lock:
+            self.connections.discard(connection)
+        try:
+            connection.close()
+        except sqlite3.Error:
+            pass
+
+
+    def isHealthy(self, connection: sqlite3.Connection):
+        try:
+            connection.execute("SELECT 1").fetchone()
+        except sqlite3.Error:
+            return False
+        return True
+
+
+    def acquire(self):
+        if self.closed:
+            raise PoolClosedError(self.DB_PATH)
+        if not self.slots.acquire(timeout = self.timeout):
+            raise TimeoutError(f"no free connection for {self.DB_PATH}")
+
+        try:
+            # 空いているコネクションを再利用、死んでいたら作り直す
+            while True:
+                try:
+                    connection = self.idle.get_nowait()
+                except queue.Empty:
+                    return self.connect()
+                if self.isHealthy(connection):
+                    return connection
+                self.discard(connection)
+        except BaseException:
+            self.slots.release()
+            raise
+
+
+    def release(self, connection: sqlite3.Connection):
+        try:
+            if connection.in_transaction:
+                connection.rollback()
+            if self.closed:
+                self.discard(connection)
+            else:
+                self.idle.put_nowait(connection)
+        except (sqlite3.Error, queue.Full):
+            self.discard(connection)
+        finally:
+            self.slots.release()
+
+
+    def close(self):
+        # 新規の貸し出しを止め、待機中のコネクションを閉じる
+        # 貸し出し中のものはreleaseされた時点で閉じられる
+        self.closed = True
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                break
+            self.discard(connection)
+
+
+    def stats(self):
+        with self.lock:
+            opened = len(self.connections)
+        return {
+            "size": self.size,
+            "opened": opened,
+            "idle": self.idle.qsize(),
+            "closed": self.closed
+        }
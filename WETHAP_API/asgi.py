@@ -0,0 +1,170 @@
+# ASGI版のWETHAP API
+# uvicorn asgi:app --port 8000
+# (starlette, uvicorn, a2wsgiが必要、requirements.txtに入っている)
+#
+# 書き込み・登録確認・getInfoはイベントループ上で処理し、SQLiteの呼び出しはスレッドプールに逃がす
+# それ以外のルートはmain.pyのFlaskアプリをそのまま使う
+import asyncio
+import functools
+import json
+import time
+from a2wsgi import WSGIMiddleware
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from datetime import datetime
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Mount, Route
+import main
+from DBManage import DBCommands
+
+# SQLiteを呼ぶスレッド、プールのコネクション数より多くしても待つだけ
+dbExecutor = ThreadPoolExecutor(max_workers = main.POOL_SIZE, thread_name_prefix = "asgi-db")
+
+
+async def runDB(function, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(dbExecutor, lambda: function(*args, **kwargs))
+
+
+def timed(route: str):
+    # Flask版と同じwethap_http_request_secondsに記録する
+    def decorator(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(request):
+            start = time.perf_counter()
+            status = "500"
+            try:
+                response = await endpoint(request)
+                status = str(response.status_code)
+                return response
+            finally:
+                main.ROUTE_SECONDS.observe(time.perf_counter() - start, route, request.method, status)
+        return wrapper
+    return decorator
+
+
+async def refreshWeather():
+    # 天気の取得はスレッドで行い、イベントループを止めない
+    # キャッシュを温めておくことで天気ワーカーも待たずに済む
+    while True:
+        try:
+            await asyncio.to_thread(main.weatherCache.get)
+        except Exception as e:
+            print(f"weather refresh failed: {e}")
+        await asyncio.sleep(main.WEATHER_TTL)
+
+
+async def index(request):
+    return JSONResponse({"status": "online"})
+
+
+async def addInfo(request):
+    try:
+        future, rows = main.submitInfo(await request.json())
+    except (TypeError, ValueError) as e:
+        return JSONResponse({"error": str(e)}, status_code = 400)
+
+    # グループコミットを待つ間もスレッドを占有しない
+    # タイムアウトしても書き込み自体は取り消さない
+    await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), main.WRITE_TIMEOUT)
+    main.forgetResponses(rows)
+    return PlainTextResponse("added", status_code = 202)
+
+
+async def addInfoBatch(request):
+    body = await request.body()
+    if request.headers.get("content-type", "").split(";")[0] in ("application/x-ndjson", "application/jsonl"):
+        records = main.parseNDJSON(body.splitlines())
+    else:
+        try:
+            records = json.loads(body)
+        except ValueError:
+            records = None
+        if not isinstance(records, list):
+            return JSONResponse({"error": "body must be a JSON array or NDJSON"}, status_code = 400)
+
+    future, rows, result = main.submitBatch(records)
+    if future is not None:
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), main.WRITE_TIMEOUT)
+        main.forgetResponses(rows)
+    return JSONResponse(result, status_code = main.batchStatus(result))
+
+
+def isRegisteredDB(labID: str):
+    db = DBCommands(DB_PATH = main.DB_PATH, pool = main.pool)
+    try:
+        return db.isRegistered(labID = labID)
+    finally:
+        db.close()
+
+
+def registeredRoomsDB():
+    db = DBCommands(DB_PATH = main.DB_PATH, pool = main.pool)
+    try:
+        return db.registeredRooms()
+    finally:
+        db.close()
+
+
+async def isRegistered(request):
+    labID = str(request.query_params.get("labID"))
+    return PlainTextResponse(str(await runDB(isRegisteredDB, labID)))
+
+
+async def registeredRooms(request):
+    return JSONResponse(await runDB(registeredRoomsDB))
+
+
+async def getInfo(request):
+    try:
+        labID = str(request.query_params.get("labID"))
+        date = datetime.strptime(str(request.query_params.get("date")), "%Y-%m-%d").strftime("%Y-%m-%d")
+        numGen = int(request.query_params.get("numGen"))
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "labID, date(yyyy-mm-dd) and numGen are required"}, status_code = 400)
+
+    cached = main.responseCache.get((labID, date, numGen))
+    if cached is None:
+        cached = await runDB(main.cachedInfo, labID = labID, date = date, numGen = numGen)
+
+    etag = f'"{cached["etag"]}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={cached['maxAge']}"}
+    if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+        return Response(status_code = 304, headers = headers)
+    return Response(cached["body"], media_type = cached["mimetype"], headers = headers)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    task = asyncio.create_task(refreshWeather())
+    yield
+    task.cancel()
+    dbExecutor.shutdown(wait = False)
+
+
+PREFIX = main.PREFIX
+
+app = Starlette(
+    routes = [
+        Route(PREFIX + "/", timed(PREFIX + "/")(index), methods = ["GET"]),
+        Route(PREFIX + "/addInfo/", timed(PREFIX + "/addInfo/")(addInfo), methods = ["POST"]),
+        Route(PREFIX + "/addInfoBatch/", timed(PREFIX + "/addInfoBatch/")(addInfoBatch), methods = ["POST"]),
+        Route(PREFIX + "/isRegistered/", timed(PREFIX + "/isRegistered/")(isRegistered), methods = ["GET"]),
+        Route(PREFIX + "/registeredRooms/", timed(PREFIX + "/registeredRooms/")(registeredRooms), methods = ["GET"]),
+        Route(PREFIX + "/getInfo/", timed(PREFIX + "/getInfo/")(getInfo), methods = ["GET"]),
+        # 残りのルートはFlaskアプリに任せる(スレッドプール上で動く)
+        Mount("/", app = WSGIMiddleware(main.app)),
+    ],
+    middleware = [
+        Middleware(CORSMiddleware, allow_origin_regex = ".*", allow_credentials = True, allow_methods = ["*"], allow_headers = ["*"]),
+    ],
+    lifespan = lifespan
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, port = main.PORT)
@@ -0,0 +1,287 @@
+import argparse
+import compactStore
+import os
+import tempfile
+import threading
+import time
+import DBManage
+from DBManage import DBCommands
+from DBPool import ConnectionPool
+from ingestWriter import IngestWriter
+import exportData
+import json
+
+
+def prepareDB(path: str, rows: int):
+    db = DBCommands(DB_PATH = path)
+    db.createDB()
+    for i in range(rows):
+        db.insert(
+            labID = f"lab{i % 20}",
+            date = "2023-05-23",
+            numGen = i % 12 + 1,
+            temperature = 25,
+            humidity = 50,
+            pressure = 1000,
+            weather = "晴れ")
+    db.close()
+
+
+def runThreads(handler, threads: int, requests: int):
+    # handlerを1リクエストとみなし、threads本のワーカーで回したときのreq/secを返す
+    perThread = requests // threads
+    def worker():
+        for _ in range(perThread):
+            handler()
+
+    workers = [threading.Thread(target = worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start
+    return perThread * threads / elapsed
+
+
+def benchPool(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepareDB(path, args.rows)
+        pool = ConnectionPool(DB_PATH = path, size = args.threads)
+
+        def readPerRequest():
+            db = DBCommands(DB_PATH = path)
+            db.isRegistered(labID = "lab1")
+            db.close()
+
+        def readPooled():
+            db = DBCommands(DB_PATH = path, pool = pool)
+            db.isRegistered(labID = "lab1")
+            db.close()
+
+        before = runThreads(readPerRequest, args.threads, args.requests)
+        after = runThreads(readPooled, args.threads, args.requests)
+        pool.close()
+
+    print(f"connect-per-request: {before:.1f} req/sec")
+    print(f"pooled:              {after:.1f} req/sec")
+    print(f"speedup:             x{after / before:.2f}")
+
+
+def benchInsert(args):
+    rows = [(f"lab{i % 20}", "2023-05-23", i, 25.0, 50.0, 1000.0, "晴れ") for i in range(args.rows)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepareDB(path, 0)
+        pool = ConnectionPool(DB_PATH = path, size = 1)
+
+        # addInfoと同じく1件ごとにcommitする
+        start = time.perf_counter()
+        for row in rows:
+            db = DBCommands(DB_PATH = path, pool = pool)
+            db.insert(*row)
+            db.close()
+        single = time.perf_counter() - start
+
+        db = DBCommands(DB_PATH = path, pool = pool)
+        db.cursor.execute("DELETE FROM readings")
+        db.close()
+
+        start = time.perf_counter()
+        db = DBCommands(DB_PATH = path, pool = pool)
+        db.insertMany(rows)
+        db.close()
+        batch = time.perf_counter() - start
+        pool.close()
+
+    print(f"{args.rows} single inserts: {single:.3f} sec ({args.rows / single:.0f} rows/sec)")
+    print(f"1 insertMany:        {batch:.3f} sec ({args.rows / batch:.0f} rows/sec)")
+    print(f"speedup:             x{single / batch:.1f}")
+
+
+def literal(value):
+    if value is None:
+        return "NULL"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    return repr(value)
+
+
+def inline(sql: str, params):
+    # ?に値を埋め込んだ、毎回文字列が変わるSQLにする(表も条件も同じまま、ステートメントキャッシュだけが効かなくなる)
+    parts = sql.split("?")
+    return "".join(part + literal(param) for part, param in zip(parts, params)) + parts[-1]
+
+
+def benchStatements(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepareDB(path, 0)
+        db = DBCommands(DB_PATH = path)
+        rows = [(f"lab{i % 20}", f"2023-{i // 1000 % 12 + 1:02d}-01", i % 1000, 25.0, 50.0, 1000.0, "晴れ") for i in range(args.rows)]
+        # 研究室と天気の番号は先に用意しておく
+        db.touchLabs(rows)
+        db.cursor.execute(DBManage.ADD_WEATHER, ("晴れ",))
+        db.connection.commit()
+
+        # 以前のDBCommandsのように値を埋め込んだ毎回違うSQL、中身はINSERT_INFO/SELECT_INFOと同じ
+        params = [compactStore.encode(row) for row in rows]
+        keys = [compactStore.encodeKey(row[:3]) for row in rows]
+        start = time.perf_counter()
+        for param in params:
+            db.cursor.execute(inline(DBManage.INSERT_INFO, param))
+        fInsert = time.perf_counter() - start
+        db.connection.rollback()
+
+        start = time.perf_counter()
+        for param in params:
+            db.cursor.execute(DBManage.INSERT_INFO, param)
+        pInsert = time.perf_counter() - start
+        db.connection.commit()
+
+        start = time.perf_counter()
+        for key in keys:
+            db.cursor.execute(inline(DBManage.SELECT_INFO, key))
+            db.cursor.fetchall()
+        fSelect = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key in keys:
+            db.cursor.execute(DBManage.SELECT_INFO, key)
+            db.cursor.fetchall()
+        pSelect = time.perf_counter() - start
+        db.close()
+
+    print(f"insert f-string:      {args.rows / fInsert:.0f} ops/sec")
+    print(f"insert parameterized: {args.rows / pInsert:.0f} ops/sec (x{fInsert / pInsert:.2f})")
+    print(f"select f-string:      {args.rows / fSelect:.0f} ops/sec")
+    print(f"select parameterized: {args.rows / pSelect:.0f} ops/sec (x{fSelect / pSelect:.2f})")
+
+
+def percentile(values, p: float):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def runBurst(handler, clients: int):
+    # 全クライアントが同時に1件ずつ送る(コマの終わりと同じ状況)
+    barrier = threading.Barrier(clients)
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def client(i):
+        barrier.wait()
+        start = time.perf_counter()
+        try:
+            handler(i)
+        except Exception as e:
+            with lock:
+                errors.append(repr(e))
+            return
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target = client, args = (i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors
+
+
+def benchBurst(args):
+    def row(i):
+        return (f"lab{i}", "2023-05-23", 1, 25.0, 50.0, 1000.0, "晴れ")
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        # 以前のaddInfo: リクエストごとに接続してcommit(rollback journal)
+        path = os.path.join(tmp, "direct.db")
+        prepareDB(path, 0)
+        def direct(i):
+            db = DBCommands(DB_PATH = path)
+            db.insert(*row(i))
+            db.close()
+        results["commit-per-request"] = runBurst(direct, args.clients)
+
+        # WAL + 書き込みスレッドでのグループコミット
+        path = os.path.join(tmp, "group.db")
+        prepareDB(path, 0)
+        pool = ConnectionPool(DB_PATH = path, size = 4)
+        writer = IngestWriter(DB_PATH = path, pool = pool)
+        writer.start()
+        def grouped(i):
+            writer.submit([row(i)]).result(timeout = 30)
+        results["group-commit"] = runBurst(grouped, args.clients)
+        writer.stop()
+        commits = writer.stats()["commits"]
+        pool.close()
+
+    for name, (latencies, errors) in results.items():
+        if latencies:
+            print(f"{name}: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, p99 {percentile(latencies, 0.99) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms, errors {len(errors)}")
+        else:
+            print(f"{name}: all {len(errors)} requests failed")
+    print(f"group-commit used {commits} commit(s) for {args.clients} posts")
+
+
+def benchExport(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        prepareDB(path, 0)
+        db = DBCommands(DB_PATH = path)
+        db.insertMany((f"lab{i % 20}", f"20{20 + i // 100000 % 10}-{i // 10000 % 12 + 1:02d}-{i // 500 % 28 + 1:02d}", i % 500, 25.0 + i % 7, 50.0 + i % 11, 1000.0 + i % 13, "晴れ") for i in range(args.rows))
+        db.close()
+
+        results = {}
+        # 以前の/previewData/: 全件を読み込んでJSONにする
+        db = DBCommands(DB_PATH = path)
+        start = time.perf_counter()
+        size = len(json.dumps(db.previewData()).encode())
+        results["json (previewData)"] = (size, time.perf_counter() - start)
+        db.close()
+
+        for format in exportData.FORMATS:
+            db = DBCommands(DB_PATH = path)
+            start = time.perf_counter()
+            size = sum(len(chunk) for chunk in exportData.export(db.iterData(), format))
+            results[format] = (size, time.perf_counter() - start)
+            db.close()
+
+    # MB/sは同じデータをJSONにした場合の大きさで揃えて比べる
+    jsonSize = results["json (previewData)"][0]
+    for name, (size, elapsed) in results.items():
+        print(f"{name}: {size / 1e6:.2f} MB written, {elapsed:.2f} sec, {args.rows / elapsed:.0f} rows/sec, {jsonSize / 1e6 / elapsed:.2f} MB/s (JSON-equivalent)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "WETHAP API benchmarks")
+    subparsers = parser.add_subparsers(dest = "command", required = True)
+
+    pool = subparsers.add_parser("pool", help = "connect-per-request vs ConnectionPool")
+    pool.add_argument("--threads", type = int, default = 8)
+    pool.add_argument("--requests", type = int, default = 4000)
+    pool.add_argument("--rows", type = int, default = 1000)
+    pool.set_defaults(func = benchPool)
+
+    insert = subparsers.add_parser("insert", help = "single insert+commit vs insertMany")
+    insert.add_argument("--rows", type = int, default = 10000)
+    insert.set_defaults(func = benchInsert)
+
+    statements = subparsers.add_parser("statements", help = "f-string SQL vs parameterized cached statements")
+    statements.add_argument("--rows", type = int, default = 20000)
+    statements.set_defaults(func = benchStatements)
+
+    burst = subparsers.add_parser("burst", help = "simultaneous posts: commit per request vs group commit")
+    burst.add_argument("--clients", type = int, default = 100)
+    burst.set_defaults(func = benchBurst)
+
+    export = subparsers.add_parser("export", help = "JSON previewData vs gzip CSV / columnar export")
+    export.add_argument("--rows", type = int, default = 200000)
+    export.set_defaults(func = benchExport)
+
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,176 @@
+# infosの実体(readings)の保存形式
+#   lab: labs.id(研究室名は1行ごとに持たない)
+#   day: 1970-01-01からの日数
+#   temperature, humidity, pressure: SCALE倍して丸めた整数(Picoが送ってくる桁数に合わせている)
+#   weather: weathers.id
+# 主キー(lab, day, numGen)のWITHOUT ROWIDテーブルで、整数は可変長で保存されるので1行が小さくなる
+# infosは元と同じ列を返すビューとして残す
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from datetime import date as Date
+
+SCALE = {"temperature": 100, "humidity": 1000, "pressure": 100}
+
+EPOCH = Date(1970, 1, 1).toordinal()
+
+# 研究室名・天気から番号を引く副問い合わせ
+LAB_ID = "(SELECT id FROM labs WHERE labID = ?)"
+WEATHER_ID = "(SELECT id FROM weathers WHERE weather = ?)"
+
+# readingsをinfosと同じ列に戻すSELECT句とFROM句
+COLUMNS = ", ".join([
+    "labs.labID AS labID",
+    "date(readings.day + 2440587.5) AS date",
+    "readings.numGen AS numGen",
+    *[f"readings.{m} / {float(scale)} AS {m}" for m, scale in SCALE.items()],
+    "weathers.weather AS weather",
+])
+SOURCE = "readings JOIN labs ON labs.id = readings.lab LEFT JOIN weathers ON weathers.id = readings.weather"
+
+# 高頻度の測定値(samples)を戻すSELECT句、tsはUNIX時間(秒)
+SAMPLE_COLUMNS = ", ".join(["samples.ts AS ts", *[f"samples.{m} / {float(scale)} AS {m}" for m, scale in SCALE.items()]])
+
+
+def toDay(date: str):
+    return Date.fromisoformat(date).toordinal() - EPOCH
+
+
+def scaled(value, scale: int):
+    return None if value is None else round(float(value) * scale)
+
+
+def encode(row):
+    # infosの1行をINSERT_INFOのパラメーターにする(研究室名と天気は副問い合わせで番号になる)
+    labID, date, numGen, temperature, humidity, pressure, weather = row
+    return (
+        labID, toDay(date), numGen,
+        scaled(temperature, SCALE["temperature"]),
+        scaled(humidity, SCALE["humidity"]),
+        scaled(pressure, SCALE["pressure"]),
+        weather)
+
+
+def encodeSample(sample):
+    # (labID, ts, temperature, humidity, pressure) -> INSERT_SAMPLEのパラメーター
+    labID, ts, temperature, humidity, pressure = sample
+    return (
+        labID, int(ts),
+        scaled(temperature, SCALE["temperature"]),
+        scaled(humidity, SCALE["humidity"]),
+        scaled(pressure, SCALE["pressure"]))
+
+
+def encodeKey(key):
+    # (labID, date, numGen) -> (labID, day, numGen)
+    return (key[0], toDay(key[1]), key[2])
+
+
+def sqlScaled(value: str, m: str):
+    return f"CAST(ROUND({value} * {SCALE[m]}) AS INTEGER)"
+
+
+def createTables(cursor: sqlite3.Cursor):
+    """infosテーブルをreadingsに移し、infosを同じ列のビューに置き換える"""
+    # labsに番号をつける(既存の研究室は名前順)
+    cursor.execute("CREATE TABLE labs_new(id INTEGER PRIMARY KEY, labID TEXT NOT NULL UNIQUE, sensor TEXT, firstSeen TEXT, lastSeen TEXT)")
+    cursor.execute("INSERT INTO labs_new(labID, sensor, firstSeen, lastSeen) SELECT labID, sensor, firstSeen, lastSeen FROM labs ORDER BY labID")
+    cursor.execute("DROP TABLE labs")
+    cursor.execute("ALTER TABLE labs_new RENAME TO labs")
+
+    cursor.execute("CREATE TABLE weathers(id INTEGER PRIMARY KEY, weather TEXT NOT NULL UNIQUE)")
+    cursor.execute("INSERT INTO weathers(weather) SELECT DISTINCT weather FROM infos WHERE weather IS NOT NULL ORDER BY weather")
+
+    cursor.execute(f"""
+        CREATE TABLE readings(
+            lab INTEGER NOT NULL REFERENCES labs(id),
+            day INTEGER NOT NULL,
+            numGen INTEGER NOT NULL,
+            {', '.join(f'{m} INTEGER' for m in SCALE)},
+            weather INTEGER REFERENCES weathers(id),
+            PRIMARY KEY (lab, day, numGen)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(f"""
+        INSERT INTO readings
+        SELECT labs.id, CAST(julianday(infos.date) - 2440587.5 AS INTEGER), infos.numGen,
+            {', '.join(sqlScaled(f'infos.{m}', m) for m in SCALE)},
+            weathers.id
+        FROM infos JOIN labs ON labs.labID = infos.labID LEFT JOIN weathers ON weathers.weather = infos.weather
+    """)
+    # previewDataのページングで(day, lab, numGen)順に辿るため
+    cursor.execute("CREATE INDEX readings_day_lab_numGen ON readings(day, lab, numGen)")
+
+    cursor.execute("DROP TABLE infos")
+    cursor.execute(f"CREATE VIEW infos AS SELECT {COLUMNS} FROM {SOURCE}")
+    # DBCommandsを通さずにinfosへ入れる古いスクリプトのため(集計表とlabsの日付は更新されない)
+    cursor.execute(f"""
+        CREATE TRIGGER infos_insert INSTEAD OF INSERT ON infos
+        BEGIN
+            INSERT OR IGNORE INTO labs(labID, firstSeen, lastSeen) VALUES(NEW.labID, NEW.date, NEW.date);
+            INSERT OR IGNORE INTO weathers(weather) SELECT NEW.weather WHERE NEW.weather IS NOT NULL;
+            INSERT OR REPLACE INTO readings VALUES(
+                (SELECT id FROM labs WHERE labID = NEW.labID),
+                CAST(julianday(NEW.date) - 2440587.5 AS INTEGER),
+                NEW.numGen,
+                {', '.join(sqlScaled(f'NEW.{m}', m) for m in SCALE)},
+                (SELECT id FROM weathers WHERE weather = NEW.weather));
+        END
+    """)
+
+
+def createSamples(cursor: sqlite3.Cursor):
+    # Picoが送ってくる1分(またはもっと細かい)ごとの測定値、readingsと同じく整数で持つ
+    cursor.execute(f"""
+        CREATE TABLE samples(
+            lab INTEGER NOT NULL REFERENCES labs(id),
+            ts INTEGER NOT NULL,
+            {', '.join(f'{m} INTEGER' for m in SCALE)},
+            PRIMARY KEY (lab, ts)
+        ) WITHOUT ROWID
+    """)
+
+
+def storageReport(connection: sqlite3.Connection, tables):
+    """tablesとそのインデックスが使っているバイト数を行数で割って返す(dbstatを使う)
+    Returns:
+        dict: {"rows", "bytes", "payload", "bytesPerRow", "payloadPerRow"}
+    """
+    names = list(tables)
+    for table in tables:
+        names += [row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'index' and tbl_name = ?", (table,))]
+    placeholders = ", ".join("?" * len(names))
+    size, payload = connection.execute(f"SELECT SUM(pgsize), SUM(payload) FROM dbstat WHERE name IN ({placeholders})", names).fetchone()
+    rows = connection.execute(f"SELECT COUNT(*) FROM {tables[0]}").fetchone()[0]
+    return {
+        "rows": rows,
+        "bytes": size or 0,
+        "payload": payload or 0,
+        "bytesPerRow": (size or 0) / rows if rows else None,
+        "payloadPerRow": (payload or 0) / rows if rows else None,
+    }
+
+
+if __name__ == "__main__":
+    # python compactStore.py ./data.db
+    # DBのコピーで、移行前(infosテーブル)と移行後(readings)の1行あたりのバイト数を比べる
+    from DBMigrate import migrate
+
+    DB_PATH = sys.argv[1] if len(sys.argv) > 1 else "./data.db"
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "report.db")
+        shutil.copyfile(DB_PATH, path)
+        connection = sqlite3.connect(path)
+
+        migrate(connection, target = 7)
+        connection.execute("VACUUM")
+        before = storageReport(connection, ["infos"])
+        migrate(connection)
+        connection.execute("VACUUM")
+        after = storageReport(connection, ["readings", "labs", "weathers"])
+        connection.close()
+
+    for name, report in (("before (infos)", before), ("after (readings + labs + weathers)", after)):
+        print(f"{name}: {report['rows']} rows, {report['bytes']} bytes in pages, {report['bytesPerRow']:.1f} bytes/row, {report['payloadPerRow']:.1f} payload bytes/row")
@@ -1,24 +1,195 @@
+# data.dbのinfosを別のDB(newdata.db)へ移し替える
+# python dataFormatConverter.py --source ./data.db --dest ./newdata.db
+#
+# 元のDBをchunk件ずつ読み、変換してからexecutemanyでまとめて書き込む
+# 書き込みと同じトランザクションで進捗(checkpoint)を保存するので、途中で止まっても続きから再開できる
+# 同じコマ(labID, date, numGen)の行が複数ある場合はマイグレーション3と同じく最初のものを残し、
+# 移し先に既にある行も上書きしない、残らなかった行は移し先のinfos_duplicatesへ移す
+import argparse
+import importlib
+import json
 import sqlite3
-from DBManage import DBCommands
+import time
 from datetime import datetime
+from compactStore import COLUMNS, SOURCE
+from DBManage import DBCommands
+
+
+def normalizeDate(row):
+    # "1970-1-1"を"1970-01-01"に揃える、揃っているものはそのまま
+    date = row[1]
+    if not isinstance(date, str) or len(date) == 10 and date[4] == "-" and date[7] == "-":
+        return row
+    return (row[0], datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d"), *row[2:])
+
+
+def dropMissingMeasurements(row):
+    # 測定値が1つもない行は移さない
+    if row[3] is None and row[4] is None and row[5] is None:
+        return None
+    return row
+
+
+# 名前で指定できる変換、module:function の形で任意の関数も指定できる
+# 変換は行(タプル)を受け取り、変換後の行か、捨てる場合はNoneを返す
+TRANSFORMS = {
+    "normalizeDate": normalizeDate,
+    "dropMissingMeasurements": dropMissingMeasurements,
+}
+
+
+def loadTransform(name: str):
+    if name in TRANSFORMS:
+        return TRANSFORMS[name]
+    module, function = name.split(":")
+    return getattr(importlib.import_module(module), function)
+
+
+def sourceLayout(connection: sqlite3.Connection):
+    # (辿るキー, 読み出す列, FROM句)
+    # 古いinfosはrowidで、WITHOUT ROWIDになったinfosは主キーで、ビューになったinfosは実体のreadingsの主キーで辿る
+    sql = connection.execute("SELECT type, sql FROM sqlite_master WHERE type IN ('table', 'view') and name = 'infos'").fetchone()
+    if sql is None:
+        raise ValueError("source has no infos table")
+    columns = "labID, date, numGen, temperature, humidity, pressure, weather"
+    if sql[0] == "view":
+        return ("readings.lab", "readings.day", "readings.numGen"), COLUMNS, SOURCE
+    if "WITHOUT ROWID" in sql[1].upper():
+        return ("labID", "date", "numGen"), columns, "infos"
+    return ("rowid",), columns, "infos"
+
+
+def readChunk(connection: sqlite3.Connection, layout, after, size: int):
+    keys, columns, source = layout
+    key = ", ".join(keys)
+    if after is None:
+        where, params = "", ()
+    else:
+        where, params = f"WHERE ({key}) > ({', '.join('?' * len(keys))})", tuple(after)
+    return connection.execute(
+        f"SELECT {key}, {columns} FROM {source} {where} ORDER BY {key} LIMIT ?",
+        (*params, size)).fetchall()
+
+
+def loadCheckpoint(db: DBCommands, source: str):
+    db.cursor.execute("CREATE TABLE IF NOT EXISTS convert_checkpoint(source TEXT PRIMARY KEY, lastKey TEXT, rows INTEGER NOT NULL, updatedAt TEXT)")
+    db.cursor.execute("SELECT lastKey, rows FROM convert_checkpoint WHERE source = ?", (source,))
+    checkpoint = db.cursor.fetchone()
+    db.connection.commit()
+    if checkpoint is None:
+        return None, 0
+    return json.loads(checkpoint[0]), checkpoint[1]
+
+
+def splitDuplicates(db: DBCommands, rows):
+    # (残す行, infos_duplicatesへ移す行)、キーが欠けた行、移し先に既にあるコマ、rowsの中で2回目以降に出てきたコマは残さない
+    existing = db.existingKeys(tuple(row[:3]) for row in rows if None not in row[:3])
+    kept = []
+    duplicates = []
+    for row in rows:
+        key = tuple(row[:3])
+        if None in key or key in existing:
+            duplicates.append(row)
+        else:
+            existing.add(key)
+            kept.append(row)
+    return kept, duplicates
+
+
+def archiveDuplicates(db: DBCommands, rows):
+    # 元のDBのrowidは移し先では意味がないので、sourceRowidは移し先で振られる番号になる
+    db.cursor.executemany(
+        "INSERT INTO infos_duplicates(labID, date, numGen, temperature, humidity, pressure, weather, archivedAt) VALUES(?, ?, ?, ?, ?, ?, ?, datetime('now'))",
+        rows)
+
+
+def saveCheckpoint(db: DBCommands, source: str, lastKey, rows: int):
+    db.cursor.execute(
+        "INSERT OR REPLACE INTO convert_checkpoint VALUES(?, ?, ?, ?)",
+        (source, json.dumps(lastKey), rows, datetime.now().isoformat(timespec = "seconds")))
+
+
+def convert(
+    source: str,
+    dest: str,
+    transforms = (normalizeDate,),
+    chunkSize: int = 5000,
+    restart: bool = False
+):
+    """sourceのinfosをdestへ移し替える
+    Args:
+        source (str): 元のDBファイル
+        dest (str): 移し先のDBファイル(なければ作る)
+        transforms (list[Callable]): 各行に順番にかける変換
+        chunkSize (int): 1トランザクションで移す行数
+        restart (bool): 進捗を無視して最初からやり直す
+    Returns:
+        int: 移した(infosに残った)行数(再開前の分を含む)
+    """
+    src = sqlite3.connect(source)
+    start = time.perf_counter()
+    converted = 0
+    archived = 0
+    try:
+        # 例外で止まったときは書きかけのチャンクを捨てる(commit済みのチャンクと進捗は残る)
+        with DBCommands(DB_PATH = dest) as newDB:
+            newDB.createDB()
+            layout = sourceLayout(src)
+            keys = layout[0]
+
+            sourceKey = f"{source}:infos"
+            if restart:
+                newDB.cursor.execute("DELETE FROM convert_checkpoint WHERE source = ?", (sourceKey,))
+                newDB.connection.commit()
+            after, total = loadCheckpoint(newDB, sourceKey)
+            if after is not None:
+                print(f"resume after {after} ({total} rows already converted)")
+
+            while True:
+                chunkStart = time.perf_counter()
+                chunk = readChunk(src, layout, after, chunkSize)
+                if not chunk:
+                    break
+
+                rows = []
+                for record in chunk:
+                    row = record[len(keys):]
+                    for transform in transforms:
+                        row = transform(row)
+                        if row is None:
+                            break
+                    if row is not None:
+                        rows.append(row)
+
+                after = list(chunk[-1][:len(keys)])
+                rows, duplicates = splitDuplicates(newDB, rows)
+                total += newDB.insertMany(rows) if rows else 0
+                archiveDuplicates(newDB, duplicates)
+                archived += len(duplicates)
+                converted += len(chunk)
+                # 行と進捗を同じトランザクションでcommitする
+                saveCheckpoint(newDB, sourceKey, after, total)
+                newDB.connection.commit()
+
+                elapsed = time.perf_counter() - chunkStart
+                print(f"{converted} rows read, {total} written, {archived} duplicates archived ({len(chunk) / elapsed:.0f} rows/sec)")
+    finally:
+        src.close()
+
+    elapsed = time.perf_counter() - start
+    if converted:
+        print(f"done: {converted} rows in {elapsed:.2f} sec ({converted / elapsed:.0f} rows/sec)")
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "infosを別のDBへ移し替える")
+    parser.add_argument("--source", default = "./data.db")
+    parser.add_argument("--dest", default = "./newdata.db")
+    parser.add_argument("--chunk", type = int, default = 5000)
+    parser.add_argument("--transform", action = "append", help = f"{', '.join(TRANSFORMS)} または module:function (複数指定可、既定はnormalizeDate)")
+    parser.add_argument("--restart", action = "store_true", help = "進捗を捨てて最初からやり直す")
+    args = parser.parse_args()
 
-DB = DBCommands(DB_PATH = "./data.db")
-newDB = DBCommands(DB_PATH = "./newdata.db")
-newDB.createDB()
-data = DB.previewData()
-
-for datum in data:
-    newDB.insert(
-    labID = datum[0],
-    date = datetime.strptime(datum[1], "%Y-%m-%d").strftime("%Y-%m-%d"),
-    numGen = datum[2],
-    temperature = datum[3],
-    humidity = datum[4],
-    pressure = datum[5],
-    weather = datum[6]
-    )
-
-newDB.close()
-DB.close()
-
-print(data)
+    transforms = [loadTransform(name) for name in (args.transform or ["normalizeDate"])]
+    convert(args.source, args.dest, transforms = transforms, chunkSize = args.chunk, restart = args.restart)
@@ -0,0 +1,175 @@
+import argparse
+import array
+import csv
+import io
+import struct
+import sys
+import time
+import zlib
+from datetime import date as Date
+from DBManage import DBCommands
+
+COLUMNS = ("labID", "date", "numGen", "temperature", "humidity", "pressure", "weather")
+
+# 列指向バイナリの形式(全体をgzipで包む)
+#   ヘッダ: b"WTHC" + バージョン(u8)
+#   ブロック: 行数(u32) + 各列
+#     文字列列(labID, weather): オフセット(u32 × 行数+1) + UTF-8のバイト列、NULLは長さ0
+#     date: 1970-01-01からの日数(i32)
+#     numGen: i16
+#     temperature, humidity, pressure: f32、NULLはNaN
+#   行数0のブロックで終わり、数値はすべてリトルエンディアン
+MAGIC = b"WTHC"
+VERSION = 1
+EPOCH = Date(1970, 1, 1).toordinal()
+
+
+def gzipChunks(chunks, level: int = 1):
+    # 文字列/バイト列のイテレーターをgzipで圧縮しながら流す
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csvChunks(rows, chunkSize: int = 1000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for i, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if i % chunkSize == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def littleEndian(values: array.array):
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def stringColumn(values):
+    offsets = array.array("I", [0])
+    encoded = []
+    for value in values:
+        data = value.encode() if value is not None else b""
+        encoded.append(data)
+        offsets.append(offsets[-1] + len(data))
+    return littleEndian(offsets) + b"".join(encoded)
+
+
+def floatColumn(values):
+    return littleEndian(array.array("f", [float("nan") if value is None else value for value in values]))
+
+
+def encodeBlock(rows):
+    columns = list(zip(*rows))
+    days = array.array("i", [Date.fromisoformat(value).toordinal() - EPOCH for value in columns[1]])
+    return b"".join([
+        struct.pack("<I", len(rows)),
+        stringColumn(columns[0]),
+        littleEndian(days),
+        littleEndian(array.array("h", columns[2])),
+        floatColumn(columns[3]),
+        floatColumn(columns[4]),
+        floatColumn(columns[5]),
+        stringColumn(columns[6]),
+    ])
+
+
+def columnarChunks(rows, blockSize: int = 4096):
+    # blockSize行ずつ列に分けて書くので、メモリ使用量はブロック1つ分で済む
+    yield MAGIC + struct.pack("<B", VERSION)
+    block = []
+    for row in rows:
+        block.append(row)
+        if len(block) == blockSize:
+            yield encodeBlock(block)
+            block = []
+    if block:
+        yield encodeBlock(block)
+    yield struct.pack("<I", 0)
+
+
+def readColumnar(fileobj):
+    """columnarChunksで書いたもの(展開後)をブロックごとに列の辞書として読む"""
+    def read(size):
+        data = fileobj.read(size)
+        if len(data) != size:
+            raise ValueError("truncated columnar export")
+        return data
+
+    def typed(code, count):
+        values = array.array(code)
+        values.frombytes(read(values.itemsize * count))
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    def strings(count):
+        offsets = typed("I", count + 1)
+        data = read(offsets[-1])
+        return [data[offsets[i]:offsets[i + 1]].decode() for i in range(count)]
+
+    if read(4) != MAGIC or struct.unpack("<B", read(1))[0] != VERSION:
+        raise ValueError("not a WETHAP columnar export")
+    while True:
+        count = struct.unpack("<I", read(4))[0]
+        if count == 0:
+            return
+        yield {
+            "labID": strings(count),
+            "date": [Date.fromordinal(day + EPOCH).isoformat() for day in typed("i", count)],
+            "numGen": typed("h", count),
+            "temperature": typed("f", count),
+            "humidity": typed("f", count),
+            "pressure": typed("f", count),
+            "weather": strings(count),
+        }
+
+
+def export(rows, format: str):
+    # 圧縮済みのバイト列を少しずつ返す
+    if format == "csv":
+        return gzipChunks(csvChunks(rows))
+    if format == "columnar":
+        return gzipChunks(columnarChunks(rows))
+    raise ValueError(f"unknown format: {format}")
+
+
+FORMATS = {
+    "csv": ("application/gzip", "csv.gz"),
+    "columnar": ("application/octet-stream", "wthc.gz"),
+}
+
+
+if __name__ == "__main__":
+    # python exportData.py --labID simo --from 2023-05-01 --to 2023-06-30 --format csv -o simo.csv.gz
+    parser = argparse.ArgumentParser(description = "infosを圧縮して書き出す")
+    parser.add_argument("--db", default = "./data.db")
+    parser.add_argument("--labID")
+    parser.add_argument("--from", dest = "dateFrom")
+    parser.add_argument("--to", dest = "dateTo")
+    parser.add_argument("--format", choices = FORMATS, default = "csv")
+    parser.add_argument("-o", "--output", required = True)
+    args = parser.parse_args()
+
+    db = DBCommands(DB_PATH = args.db)
+    rows = db.iterData(labID = args.labID, dateFrom = args.dateFrom, dateTo = args.dateTo)
+    start = time.perf_counter()
+    written = 0
+    with open(args.output, "wb") as f:
+        for chunk in export(rows, args.format):
+            f.write(chunk)
+            written += len(chunk)
+    elapsed = time.perf_counter() - start
+    db.close()
+
+    print(f"{written / 1e6:.2f} MB in {elapsed:.2f} sec ({written / 1e6 / elapsed:.2f} MB/s)")
@@ -0,0 +1,105 @@
+import math
+from datetime import datetime
+
+MEASUREMENTS = ("temperature", "humidity", "pressure")
+
+# 受け付ける測定値の範囲(両端を含む)、範囲外やnan/infはセンサーの故障か送信側の不具合として弾く
+# 気圧の-1は気圧センサーがない(DHT11)ことを表す
+RANGES = {
+    "temperature": (-50.0, 100.0),
+    "humidity": (0.0, 100.0),
+    "pressure": (-1.0, 1200.0),
+}
+NUMGEN_RANGE = (0, 999)
+
+
+def parseMeasurements(datum):
+    # Picoは測定値を文字列で送ってくるのでfloatに揃える
+    values = []
+    for key in MEASUREMENTS:
+        try:
+            value = float(datum.get(key))
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"{key} must be a number")
+        low, high = RANGES[key]
+        if not math.isfinite(value) or not low <= value <= high:
+            raise ValueError(f"{key} must be between {low:g} and {high:g}")
+        values.append(value)
+    return values
+
+
+def parseInfo(datum, today: str):
+    """POSTされた1件分のデータを検証してinfosの1行にする
+    Args:
+        datum (dict): labID, numGen, temperature, humidity, pressureを持つ辞書
+            dateとweatherは省略可能(dateの省略時はtoday)
+        today (str): 今日の日付(yyyy-mm-dd)
+    Returns:
+        tuple: (labID, date, numGen, temperature, humidity, pressure, weather)
+    Raises:
+        ValueError: 不正なデータのとき
+    """
+    if not isinstance(datum, dict):
+        raise ValueError("record must be an object")
+
+    labID = datum.get("labID")
+    if not isinstance(labID, str) or not labID:
+        raise ValueError("labID must be a non-empty string")
+
+    try:
+        numGen = int(datum.get("numGen"))
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("numGen must be an integer")
+    if not NUMGEN_RANGE[0] <= numGen <= NUMGEN_RANGE[1]:
+        raise ValueError(f"numGen must be between {NUMGEN_RANGE[0]} and {NUMGEN_RANGE[1]}")
+
+    date = datum.get("date") or today
+    try:
+        date = datetime.strptime(str(date), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        raise ValueError("date must be yyyy-mm-dd")
+
+    values = parseMeasurements(datum)
+
+    weather = datum.get("weather")
+    if weather is not None and not isinstance(weather, str):
+        raise ValueError("weather must be a string")
+
+    return (labID, date, numGen, *values, weather)
+
+
+def parseSample(datum, now: int, maxAge: int, maxSkew: int):
+    """高頻度モードで送られた測定値1件を検証する
+    Args:
+        datum (dict): ts, temperature, humidity, pressureを持つ辞書
+            tsはUNIX時間(秒)かISO 8601の日時("2023-05-23T00:25:00Z"など、タイムゾーンがなければサーバーのローカル時刻)
+        now (int): 今のUNIX時間
+        maxAge (int): 受け付ける最も古いtsが何秒前までか
+        maxSkew (int): Picoの時計のずれとして、何秒先のtsまで受け付けるか
+    Returns:
+        tuple: (ts, temperature, humidity, pressure)
+    Raises:
+        ValueError: 不正なデータのとき
+    """
+    if not isinstance(datum, dict):
+        raise ValueError("sample must be an object")
+
+    ts = datum.get("ts")
+    if isinstance(ts, (int, float)) and not isinstance(ts, bool):
+        if not math.isfinite(ts):
+            raise ValueError("ts must be finite")
+    elif isinstance(ts, str):
+        try:
+            ts = datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+        except (ValueError, OverflowError, OSError):
+            raise ValueError("ts must be a UNIX time or an ISO 8601 datetime")
+    else:
+        raise ValueError("ts must be a UNIX time or an ISO 8601 datetime")
+    # 範囲外のtsはdatetimeに変換できなかったり、数年分のコマを作らせたりするので弾く
+    if not now - maxAge <= ts <= now + maxSkew:
+        raise ValueError(f"ts must be within {maxAge} seconds before and {maxSkew} seconds after the server time")
+    ts = int(ts)
+
+    values = parseMeasurements(datum)
+
+    return (ts, *values)
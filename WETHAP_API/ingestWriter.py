@@ -0,0 +1,183 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+import metrics
+from DBManage import DBCommands
+
+ROWS_INGESTED = metrics.counter("wethap_ingested_rows_total", "Rows committed to infos", ("labID",))
+SAMPLES_INGESTED = metrics.counter("wethap_ingested_samples_total", "Samples committed to samples", ("labID",))
+COMMIT_SECONDS = metrics.histogram("wethap_ingest_commit_seconds", "Time to write and commit one group")
+
+
+class IngestWriter:
+    def __init__(
+        self,
+        DB_PATH: str,
+        pool = None,
+        weatherQueue = None,
+        maxRows: int = 500,
+        maxDelay: float = 0.02
+    ):
+        """書き込みを1本のスレッドに集め、まとめてcommitする(グループコミット)
+        Args:
+            DB_PATH (str): DBファイルのパス
+            pool (ConnectionPool): 使うコネクションプール
+            weatherQueue (WeatherQueue): 天気の後付けジョブを積む先
+            maxRows (int): 1回のcommitにまとめる最大行数
+            maxDelay (float): 最初の書き込みが来てからcommitするまで待つ最大秒数
+        """
+        self.DB_PATH = DB_PATH
+        self.pool = pool
+        self.weatherQueue = weatherQueue
+        self.maxRows = maxRows
+        self.maxDelay = maxDelay
+        self.requests = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+        self.counters = {"commits": 0, "rows": 0, "errors": 0}
+
+
+    def submit(
+        self,
+        rows,
+        weatherKeys = (),
+        sensors: dict = None,
+        samples = (),
+        periods = ()
+    ):
+        """書き込みを予約する
+        Args:
+            rows (list[tuple]): infosに入れる行
+            weatherKeys (list[tuple]): 天気を後から埋める(labID, date, numGen)
+            sensors (dict): 研究室IDとセンサー名
+            samples (list[tuple]): samplesに入れる(labID, date, ts, temperature, humidity, pressure)
+            periods (list[tuple]): samplesを書いた後にinfosの行を作るコマ
+                (labID, date, numGen, 開始, 終了, force)、DBCommands.derivePeriodを参照
+        Returns:
+            Future: commitされると挿入行数(infosとsamplesの合計)が入る
+        """
+        future = Future()
+        self.requests.put((list(rows), list(weatherKeys), sensors or {}, future, list(samples), list(periods)))
+        return future
+
+
+    def start(self):
+        self.thread = threading.Thread(target = self.run, name = "ingest-writer", daemon = True)
+        self.thread.start()
+
+
+    def stop(self, timeout: float = 10.0):
+        # 残っている書き込みを済ませてから止まる
+        if self.thread is not None:
+            self.requests.put(None)
+            self.thread.join(timeout)
+            self.thread = None
+
+
+    def depth(self):
+        return self.requests.qsize()
+
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+
+            batch = [request]
+            rowCount = len(request[0]) + len(request[4])
+            deadline = time.monotonic() + self.maxDelay
+            stopping = False
+            while rowCount < self.maxRows:
+                try:
+                    request = self.requests.get(timeout = max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if request is None:
+                    stopping = True
+                    break
+                batch.append(request)
+                rowCount += len(request[0]) + len(request[4])
+
+            self.write(batch)
+            if stopping:
+                return
+
+
+    def write(self, batch):
+        # リクエストごとにSAVEPOINTを張り、失敗したリクエストだけ巻き戻す(他のリクエストはそのままcommitする)
+        start = time.perf_counter()
+        results = []
+        try:
+            db = DBCommands(DB_PATH = self.DB_PATH, pool = self.pool)
+            try:
+                today = datetime.now().strftime("%Y-%m-%d")
+                if not db.connection.in_transaction:
+                    db.cursor.execute("BEGIN IMMEDIATE")
+                for rows, weatherKeys, sensors, future, samples, periods in batch:
+                    addedLabs = set(db.addedLabs)
+                    db.cursor.execute("SAVEPOINT request")
+                    try:
+                        count = db.insertSamples(samples) if samples else 0
+                        # 書いたsamplesからコマの行を作る、今日の分は天気を後から埋める
+                        derived = [row for row in (db.derivePeriod(*period) for period in periods) if row is not None]
+                        weatherKeys = weatherKeys + [row[:3] for row in derived if row[6] is None and row[1] == today]
+                        count += db.insertMany(rows + derived) if rows or derived else 0
+                        if self.weatherQueue is not None:
+                            self.weatherQueue.enqueueMany(db, keys = weatherKeys)
+                        for labID, sensor in sensors.items():
+                            db.registerLab(labID = labID, sensor = sensor)
+                    except Exception as e:
+                        db.cursor.execute("ROLLBACK TO request")
+                        db.cursor.execute("RELEASE request")
+                        db.addedLabs = addedLabs
+                        results.append(e)
+                    else:
+                        db.cursor.execute("RELEASE request")
+                        results.append(count)
+            except BaseException:
+                # 途中まで書いた分はcommitしない
+                db.connection.rollback()
+                db.addedLabs.clear()
+                raise
+            finally:
+                db.close()
+        except Exception as e:
+            with self.lock:
+                self.counters["errors"] += len(batch)
+            for request in batch:
+                if not request[3].cancelled():
+                    request[3].set_exception(e)
+            return
+
+        if self.weatherQueue is not None:
+            self.weatherQueue.wakeup.set()
+        COMMIT_SECONDS.observe(time.perf_counter() - start)
+        for (rows, _, _, _, samples, _), result in zip(batch, results):
+            if isinstance(result, Exception):
+                continue
+            for row in rows:
+                ROWS_INGESTED.inc(row[0])
+            for sample in samples:
+                SAMPLES_INGESTED.inc(sample[0])
+        with self.lock:
+            self.counters["commits"] += 1
+            self.counters["rows"] += sum(result for result in results if not isinstance(result, Exception))
+            self.counters["errors"] += sum(1 for result in results if isinstance(result, Exception))
+        for request, result in zip(batch, results):
+            # 待ち側が諦めて取り消したFutureには結果を入れられない
+            if request[3].cancelled():
+                continue
+            if isinstance(result, Exception):
+                request[3].set_exception(result)
+            else:
+                request[3].set_result(result)
+
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["depth"] = self.depth()
+        return stats
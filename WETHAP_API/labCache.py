@@ -0,0 +1,48 @@
+import threading
+import time
+
+
+class LabCache:
+    def __init__(self, ttl: float = 60.0):
+        """登録済み研究室IDのプロセス内キャッシュ
+        Args:
+            ttl (float): 他のプロセスでの追加を取り込むため、読み直すまでの秒数
+        """
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.labs = None
+        self.loadedAt = 0.0
+
+
+    def get(self, load):
+        # loadはDBから研究室ID一覧を読む関数、期限切れのときだけ呼ぶ
+        with self.lock:
+            if self.labs is not None and time.monotonic() - self.loadedAt < self.ttl:
+                return self.labs
+        labs = frozenset(load())
+        with self.lock:
+            self.labs = labs
+            self.loadedAt = time.monotonic()
+        return labs
+
+
+    def add(self, labIDs):
+        with self.lock:
+            if self.labs is not None:
+                self.labs = self.labs | frozenset(labIDs)
+
+
+    def invalidate(self):
+        with self.lock:
+            self.labs = None
+
+
+# DBファイルごとに1つ
+CACHES = {}
+CACHES_LOCK = threading.Lock()
+
+def cacheFor(DB_PATH: str):
+    with CACHES_LOCK:
+        if DB_PATH not in CACHES:
+            CACHES[DB_PATH] = LabCache()
+        return CACHES[DB_PATH]
@@ -0,0 +1,210 @@
+# Picoの群れとLINE botの利用者を模した負荷試験
+# python loadtest.py --labs 50 --bursts 3 --readers 10 -o result.json
+#
+# 何も指定しなければ一時DBとスタブの天気ページを用意してmain.pyを起動し、それに対して試験する
+# --url を指定すると起動済みのサーバーを相手にする
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "/WETHAP/api"
+
+
+class StubWeatherPage(BaseHTTPRequestHandler):
+    # fetchWeatherが読むのと同じ形のページを返す
+    def do_GET(self):
+        body = '<ul class="weather-now__ul"><li>天気晴れ</li></ul>'.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def request(self, endpoint: str, url: str, data: dict = None):
+        if data is not None:
+            request = urllib.request.Request(url, data = json.dumps(data).encode(), headers = {"Content-Type": "application/json"})
+        else:
+            request = urllib.request.Request(url)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout = 30) as response:
+                response.read()
+            ok = True
+        except (urllib.error.URLError, OSError):
+            ok = False
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.latencies.setdefault(endpoint, [])
+            self.errors.setdefault(endpoint, 0)
+            if ok:
+                self.latencies[endpoint].append(elapsed)
+            else:
+                self.errors[endpoint] += 1
+
+    def report(self, duration: float):
+        def percentile(values, p):
+            return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else None
+
+        endpoints = {}
+        with self.lock:
+            for endpoint, latencies in self.latencies.items():
+                latencies = sorted(latencies)
+                total = len(latencies) + self.errors[endpoint]
+                endpoints[endpoint] = {
+                    "requests": total,
+                    "errors": self.errors[endpoint],
+                    "errorRate": self.errors[endpoint] / total if total else 0.0,
+                    "throughput": total / duration,
+                    "latencyMs": {
+                        "p50": percentile(latencies, 0.5),
+                        "p90": percentile(latencies, 0.9),
+                        "p99": percentile(latencies, 0.99),
+                        "max": latencies[-1] * 1000 if latencies else None
+                    }
+                }
+        return endpoints
+
+
+def startServer(port: int, workdir: str):
+    # スタブの天気ページと一時DBでmain.pyを起動する
+    weather = ThreadingHTTPServer(("127.0.0.1", 0), StubWeatherPage)
+    threading.Thread(target = weather.serve_forever, daemon = True).start()
+
+    env = dict(
+        os.environ,
+        WETHAP_DB_PATH = os.path.join(workdir, "loadtest.db"),
+        WETHAP_WEATHER_URL = f"http://127.0.0.1:{weather.server_port}/",
+        WETHAP_PORT = str(port))
+    server = subprocess.Popen(
+        [sys.executable, "main.py"],
+        cwd = os.path.dirname(os.path.abspath(__file__)),
+        env = env,
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(url + PREFIX + "/", timeout = 1).read()
+            break
+        except (urllib.error.URLError, OSError):
+            if server.poll() is not None:
+                raise RuntimeError("main.py exited during startup")
+            time.sleep(0.1)
+    else:
+        server.terminate()
+        raise RuntimeError("main.py did not start")
+    return url, server, weather
+
+
+def currentCommit():
+    # 結果をコミット間で比べられるよう、どのコミットで測ったかを残す
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd = os.path.dirname(os.path.abspath(__file__)),
+            capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args, url: str):
+    recorder = Recorder()
+    labs = [f"loadtest-lab{i}" for i in range(args.labs)]
+    today = datetime.now().strftime("%Y-%m-%d")
+    done = threading.Event()
+    barrier = threading.Barrier(args.labs)
+
+    def pico(labID):
+        # 全台が同じ瞬間に送る(コマの終了時刻)
+        for burst in range(args.bursts):
+            barrier.wait()
+            recorder.request("addInfo", url + PREFIX + "/addInfo/", {
+                "labID": labID,
+                "numGen": burst + 1,
+                "temperature": f"{random.uniform(15, 30):.2f}",
+                "humidity": f"{random.uniform(30, 70):.3f}",
+                "pressure": f"{random.uniform(990, 1020):.2f}",
+            })
+            time.sleep(args.interval)
+
+    def bot():
+        # LINE botと同じく、登録確認のあとに1コマ分を問い合わせる
+        while not done.is_set():
+            labID = random.choice(labs) if random.random() < 0.9 else "unknown-lab"
+            query = urllib.parse.urlencode({"labID": labID})
+            recorder.request("isRegistered", f"{url}{PREFIX}/isRegistered/?{query}")
+            query = urllib.parse.urlencode({"labID": labID, "date": today, "numGen": random.randint(1, args.bursts)})
+            recorder.request("getInfo", f"{url}{PREFIX}/getInfo/?{query}")
+
+    picos = [threading.Thread(target = pico, args = (labID,)) for labID in labs]
+    bots = [threading.Thread(target = bot) for _ in range(args.readers)]
+    start = time.perf_counter()
+    for thread in picos + bots:
+        thread.start()
+    for thread in picos:
+        thread.join()
+    done.set()
+    for thread in bots:
+        thread.join()
+    duration = time.perf_counter() - start
+
+    return {
+        "commit": currentCommit(),
+        "startedAt": datetime.now().isoformat(timespec = "seconds"),
+        "config": {"labs": args.labs, "bursts": args.bursts, "readers": args.readers, "interval": args.interval},
+        "durationSec": duration,
+        "endpoints": recorder.report(duration)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "WETHAP API load test")
+    parser.add_argument("--url", help = "起動済みサーバーのURL(例: http://127.0.0.1:8000)")
+    parser.add_argument("--port", type = int, default = 8765)
+    parser.add_argument("--labs", type = int, default = 50)
+    parser.add_argument("--bursts", type = int, default = 3)
+    parser.add_argument("--interval", type = float, default = 1.0, help = "バースト間の秒数")
+    parser.add_argument("--readers", type = int, default = 10)
+    parser.add_argument("-o", "--output", help = "結果のJSONを書き出すファイル(省略時は標準出力)")
+    args = parser.parse_args()
+
+    if args.url:
+        result = run(args, args.url.rstrip("/"))
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            url, server, weather = startServer(args.port, workdir)
+            try:
+                result = run(args, url)
+            finally:
+                server.terminate()
+                server.wait()
+                weather.shutdown()
+
+    output = json.dumps(result, indent = 2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
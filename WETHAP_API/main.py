@@ -1,74 +1,414 @@
 from flask import *
 from flask_cors import CORS
-from datetime import datetime
+from datetime import datetime, timedelta
 from DBManage import DBCommands
+from DBPool import ConnectionPool
 from fetchWeather import fetchWeather
+from weatherCache import WeatherCache
+from weatherQueue import WeatherQueue
+from ingestWriter import IngestWriter
+from retention import RetentionJob, RetentionPolicy
+from infoValidator import parseInfo, parseSample
+from responseCache import ResponseCache
+import exportData
+import metrics
+import periods
+import rollup
+import atexit
+import base64
+import hashlib
 import json
+import os
+import time
 
 app = Flask(__name__)
 CORS(app, supports_credentials = True)
 
 PREFIX = "/WETHAP/api"
+# 負荷試験などで差し替えられるよう環境変数でも指定できる
+DB_PATH = os.environ.get("WETHAP_DB_PATH", "./data.db")
+WEATHER_URL = os.environ.get("WETHAP_WEATHER_URL")
+PORT = int(os.environ.get("WETHAP_PORT", 8000))
+POOL_SIZE = 8
+WEATHER_TTL = 300
+WEATHER_WORKERS = 2
+GROUP_COMMIT_ROWS = 500
+GROUP_COMMIT_DELAY = 0.02
+WRITE_TIMEOUT = 10
+PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+# 各コマの終了時刻(Picoがデータを送る時刻)
+FINISH_TIME = ("09:25", "10:10", "11:10", "11:55", "13:30", "14:15", "15:15", "16:00", "17:00", "17:45", "18:45", "19:30")
+# 終わったコマもaddInfoBatchで後から書き直せるので、キャッシュは短めにしてETagで確認させる
+# 間引きの境目(rawSince)より前のコマはもう書き込めないので長くキャッシュさせる
+FROZEN_MAX_AGE = 60 * 60 * 24 * 30
+PAST_MAX_AGE = 60 * 10
+TODAY_MAX_AGE = 60
+RESPONSE_CACHE_SIZE = 4096
+RESPONSE_CACHE_TTL = 60 * 60
+# 高頻度モード: 1コマの長さ(分)と、コマの行を作り忘れないよう遡って確認する秒数
+PERIOD_LENGTH = 45
+SAMPLE_LOOKBACK = 60 * 60
+MAX_SAMPLES = 10000
+# 受け付けるtsの範囲(何秒前から何秒先まで)と、1リクエストに含められる期間(秒)
+SAMPLE_MAX_AGE = 60 * 60 * 24 * 2
+SAMPLE_MAX_SKEW = 60 * 5
+SAMPLE_MAX_SPAN = 60 * 60 * 24
+# 生データは90日(学期の初日まで戻す)、日ごとの集計は1年残し、それより前は週ごとの集計だけにする
+# 間引きはデータを消すので、WETHAP_RETENTION=1のときだけ動かす(先にバックアップを取ること、retention.py参照)
+RETENTION_ENABLED = os.environ.get("WETHAP_RETENTION") == "1"
+RAW_RETENTION_DAYS = 90
+DAILY_RETENTION_DAYS = 365
+WEEKLY_RETENTION_DAYS = None
+SAMPLE_RETENTION_DAYS = 30
+RETENTION_INTERVAL = 60 * 60 * 24
+
+pool = ConnectionPool(DB_PATH = DB_PATH, size = POOL_SIZE)
+atexit.register(pool.close)
+ROUTE_SECONDS = metrics.histogram("wethap_http_request_seconds", "Time to handle a request", ("route", "method", "status"))
+weatherFetch = metrics.track(
+    (lambda: fetchWeather(WEATHER_URL)) if WEATHER_URL else fetchWeather,
+    metrics.histogram("wethap_weather_fetch_seconds", "Time to fetch and parse the weather page"),
+    metrics.counter("wethap_weather_fetch_failures_total", "Failed weather fetches"))
+weatherCache = WeatherCache(fetch = weatherFetch, ttl = WEATHER_TTL)
+
+# 起動時にDBのスキーマを最新版へ更新する
+with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+    db.createDB()
+
+# 天気は受信後にバックグラウンドで埋める
+weatherQueue = WeatherQueue(DB_PATH = DB_PATH, fetch = weatherCache.getWithTime, pool = pool, workers = WEATHER_WORKERS)
+weatherQueue.start()
+atexit.register(weatherQueue.stop)
+
+# 書き込みは1本のスレッドに集めてまとめてcommitする
+ingestWriter = IngestWriter(DB_PATH = DB_PATH, pool = pool, weatherQueue = weatherQueue, maxRows = GROUP_COMMIT_ROWS, maxDelay = GROUP_COMMIT_DELAY)
+ingestWriter.start()
+atexit.register(ingestWriter.stop)
+
+# 古いデータの間引きは1日1回、少しずつ行う(起動直後には行わない)
+retentionJob = RetentionJob(
+    DB_PATH = DB_PATH,
+    policy = RetentionPolicy(rawDays = RAW_RETENTION_DAYS, dailyDays = DAILY_RETENTION_DAYS, weeklyDays = WEEKLY_RETENTION_DAYS, sampleDays = SAMPLE_RETENTION_DAYS),
+    pool = pool,
+    interval = RETENTION_INTERVAL)
+if RETENTION_ENABLED:
+    retentionJob.start()
+    atexit.register(retentionJob.stop)
+
+# getInfoの応答(シリアライズ済み)をクエリごとに保持する
+responseCache = ResponseCache(maxSize = RESPONSE_CACHE_SIZE)
+
+metrics.gauge("wethap_ingest_queue_depth", "Write requests waiting for the ingest writer", ingestWriter.depth)
+metrics.gauge("wethap_weather_cache_age_seconds", "Age of the cached weather", lambda: weatherCache.age())
+metrics.gauge("wethap_response_cache_entries", "Entries in the getInfo response cache", lambda: responseCache.stats()["size"])
+
+
+@app.before_request
+def startTimer():
+    g.startedAt = time.perf_counter()
+
+
+@app.after_request
+def recordTime(response):
+    if "startedAt" in g:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        ROUTE_SECONDS.observe(time.perf_counter() - g.startedAt, route, request.method, str(response.status_code))
+    return response
+
+
+@app.route("/metrics", methods = ["GET"])
+@app.route(PREFIX + "/metrics", methods = ["GET"])
+def metricsText():
+    return Response(metrics.render(), mimetype = "text/plain; version=0.0.4")
 
 @app.route(PREFIX + "/", methods = ["GET"])
 def index():
     return {"status":"online"}
 
 
+def submitInfo(data):
+    # addInfoの本体、Flask版とASGI版(asgi.py)で共通
+    # 日付はPicoの時計ではなくサーバーの受信日を使う
+    today = datetime.now().strftime("%Y-%m-%d")
+    row = parseInfo(dict(data, date = today, weather = None), today = today)
+    sensors = {row[0]: str(data["sensor"])} if data.get("sensor") else None
+    return ingestWriter.submit([row], weatherKeys = [row[:3]], sensors = sensors), [row]
+
+
+def parseNDJSON(lines):
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError as e:
+            records.append(e)
+    return records
+
+
+def submitBatch(records):
+    # addInfoBatchの本体、書き込みのFuture(なければNone)、行、応答を返す
+    today = datetime.now().strftime("%Y-%m-%d")
+    # 間引きで生データを消した日付より前の行はinsertManyが入れないので、ここで"skipped"として返す
+    with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+        since = db.rawSince()
+    rows = []
+    results = []
+    skipped = 0
+    for index, record in enumerate(records):
+        try:
+            if isinstance(record, Exception):
+                raise ValueError(f"invalid JSON: {record}")
+            row = parseInfo(record, today = today)
+        except ValueError as e:
+            results.append({"index": index, "status": "error", "error": str(e)})
+            continue
+        if since is not None and row[1] < since:
+            results.append({"index": index, "status": "skipped", "reason": f"date is before the retention cutoff {since}"})
+            skipped += 1
+            continue
+        rows.append(row)
+        results.append({"index": index, "status": "added"})
+
+    future = None
+    if rows:
+        # 天気が付いていない今日のデータだけ後から天気を埋める
+        weatherKeys = [row[:3] for row in rows if row[6] is None and row[1] == today]
+        future = ingestWriter.submit(rows, weatherKeys = weatherKeys)
+
+    return future, rows, {
+        "added": len(rows),
+        "skipped": skipped,
+        "failed": len(results) - len(rows) - skipped,
+        "results": results
+    }
+
+
+def batchStatus(result):
+    # 1件でも入れば202、入らなかったうち不正なものがあれば400、古くて入れなかっただけなら200
+    if result["added"]:
+        return 202
+    return 400 if result["failed"] else 200
+
+
+def submitSamples(data):
+    # addSamplesの本体、書き込みのFuture、書いたかもしれないコマ、応答を返す
+    if not isinstance(data, dict):
+        raise ValueError("body must be an object")
+    labID = data.get("labID")
+    if not isinstance(labID, str) or not labID:
+        raise ValueError("labID must be a non-empty string")
+    records = data.get("samples")
+    if not isinstance(records, list) or not records:
+        raise ValueError("samples must be a non-empty array")
+    if len(records) > MAX_SAMPLES:
+        raise ValueError(f"at most {MAX_SAMPLES} samples per request")
+
+    now = int(time.time())
+    samples = []
+    for index, record in enumerate(records):
+        try:
+            ts, *values = parseSample(record, now = now, maxAge = SAMPLE_MAX_AGE, maxSkew = SAMPLE_MAX_SKEW)
+        except ValueError as e:
+            raise ValueError(f"samples[{index}]: {e}")
+        samples.append((labID, datetime.fromtimestamp(ts).strftime("%Y-%m-%d"), ts, *values))
+
+    # 作るコマの数(書き込みスレッドの仕事量)を抑えるため、1リクエストの期間に上限を設ける
+    earliest = min(sample[2] for sample in samples)
+    if max(sample[2] for sample in samples) - earliest > SAMPLE_MAX_SPAN:
+        raise ValueError(f"samples must span at most {SAMPLE_MAX_SPAN} seconds")
+
+    # 終わったコマの行をsamplesから作る
+    # このリクエストに含まれるコマは作り直し、含まれないが直前に終わったコマはまだ行がなければ作る
+    latest = min(max(sample[2] for sample in samples), now)
+    touched = {window for window in (periods.windowOf(sample[2], FINISH_TIME, PERIOD_LENGTH) for sample in samples) if window is not None}
+    windows = {window: False for window in periods.windowsEnding(earliest - SAMPLE_LOOKBACK, latest, FINISH_TIME, PERIOD_LENGTH)}
+    windows.update({window: True for window in touched if window[3] <= now})
+    derive = [(labID, date, numGen, start, end, force) for (date, numGen, start, end), force in windows.items()]
+
+    sensors = {labID: str(data["sensor"])} if data.get("sensor") else None
+    future = ingestWriter.submit([], sensors = sensors, samples = samples, periods = derive)
+    return future, [period[:3] for period in derive], {"added": len(samples), "periods": len(derive)}
+
+
+def forgetResponses(rows):
+    # 書き込んだコマのgetInfoキャッシュを捨てる
+    for row in rows:
+        responseCache.discard(row[:3])
+
+
 @app.route(PREFIX + "/addInfo/", methods = ["POST"])
 def addInfo():
-    db = DBCommands(DB_PATH = "./data.db")
-    data = request.get_json()
-    db.insert(
-        labID = data["labID"],
-        numGen = data["numGen"],
-        date = datetime.now().strftime("%Y-%m-%d"),
-        temperature = data["temperature"],
-        humidity = data["humidity"],
-        pressure = data["pressure"],
-        weather = fetchWeather())
-    db.close()
+    try:
+        future, rows = submitInfo(request.get_json())
+    except (TypeError, ValueError) as e:
+        return {"error": str(e)}, 400
+
+    future.result(timeout = WRITE_TIMEOUT)
+    forgetResponses(rows)
     print(request)
-    return "added"
+    return "added", 202
+
+
+@app.route(PREFIX + "/addSamples/", methods = ["POST"])
+def addSamples():
+    # {"labID": ..., "samples": [{"ts": ..., "temperature": ..., ...}, ...]}
+    try:
+        future, keys, result = submitSamples(request.get_json(silent = True))
+    except ValueError as e:
+        return {"error": str(e)}, 400
+
+    future.result(timeout = WRITE_TIMEOUT)
+    forgetResponses(keys)
+    return result, 202
+
+
+@app.route(PREFIX + "/addInfoBatch/", methods = ["POST"])
+def addInfoBatch():
+    # JSON配列かNDJSON(1行1件)を受け付け、まとめて1トランザクションで書き込む
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        records = parseNDJSON(request.stream)
+    else:
+        records = request.get_json(silent = True)
+        if not isinstance(records, list):
+            return {"error": "body must be a JSON array or NDJSON"}, 400
+
+    future, rows, result = submitBatch(records)
+    if future is not None:
+        future.result(timeout = WRITE_TIMEOUT)
+        forgetResponses(rows)
+
+    return result, batchStatus(result)
+
+
+@app.route(PREFIX + "/weatherQueue/", methods = ["GET"])
+def weatherQueueStats():
+    return weatherQueue.stats()
 
 
 @app.route(PREFIX + "/isRegistered/", methods = ["GET"])
 def isRegistered():
-    db = DBCommands(DB_PATH = "./data.db")
     labID = str(request.args.get("labID"))
-    isRegistered = db.isRegistered(labID = labID)
-    db.close()
+    with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+        isRegistered = db.isRegistered(labID = labID)
 
     return str(isRegistered)
 
 @app.route(PREFIX + "/registeredRooms/", methods = ["GET"])
 def registeredRooms():
-    db = DBCommands(DB_PATH = "./data.db")
-    data = db.registeredRooms()
-    db.close()
+    with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+        data = db.registeredRooms()
+
+    return jsonify(data)
+
+def encodeCursor(row):
+    # 最後に返した行の(date, labID, numGen)を次ページの目印にする
+    key = json.dumps([row[1], row[0], row[2]], ensure_ascii = False)
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decodeCursor(token: str):
+    # 壊れた目印はNone(400を返す)、日付がyyyy-mm-ddでないものもここで弾く
+    try:
+        date, labID, numGen = json.loads(base64.urlsafe_b64decode(token.encode()))
+        if not isinstance(date, str) or not isinstance(labID, str) or type(numGen) is not int:
+            return None
+        if datetime.strptime(date, "%Y-%m-%d").strftime("%Y-%m-%d") != date:
+            return None
+    except (TypeError, ValueError):
+        return None
+    return (date, labID, numGen)
+
 
-    return data
+def pagedRows(
+    after: tuple = None,
+    labID: str = None,
+    dateFrom: str = None,
+    dateTo: str = None
+):
+    # PAGE_SIZE件ずつ読み、1ページ読むたびにコネクションをプールへ返す
+    # 遅いクライアントへ流している間もプールのコネクションを握ったままにしない(ページごとに別の読み取りになる)
+    while True:
+        with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+            rows = db.previewPage(limit = PAGE_SIZE, after = after, labID = labID, dateFrom = dateFrom, dateTo = dateTo)
+        yield from rows
+        if len(rows) < PAGE_SIZE:
+            break
+        after = (rows[-1][1], rows[-1][0], rows[-1][2])
+
+
+def streamData(after, mode: str):
+    # ページごとに読みながら書き出す
+    if mode == "ndjson":
+        for row in pagedRows(after = after):
+            yield json.dumps(row) + "\n"
+    else:
+        yield "["
+        for i, row in enumerate(pagedRows(after = after)):
+            yield ("," if i else "") + json.dumps(row)
+        yield "]"
+
+
+@app.route(PREFIX + "/labs/", methods = ["GET"])
+def labs():
+    with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+        data = db.labInfos()
+
+    return jsonify([
+        {
+            "labID": datum[0],
+            "sensor": datum[1],
+            "firstSeen": datum[2],
+            "lastSeen": datum[3]
+        } for datum in data
+    ])
 
 @app.route(PREFIX + "/previewData/", methods = ["GET"])
 def previewData():
-    db = DBCommands(DB_PATH = "./data.db")
-    data = db.previewData()
-    db.close()
+    after = None
+    if request.args.get("cursor"):
+        after = decodeCursor(request.args["cursor"])
+        if after is None:
+            return {"error": "invalid cursor"}, 400
 
-    return data
+    # limitかcursorを指定するとページ単位で返す
+    if "limit" in request.args or "cursor" in request.args:
+        limit = min(max(request.args.get("limit", PAGE_SIZE, type = int), 1), MAX_PAGE_SIZE)
+        with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+            data = db.previewPage(limit = limit, after = after)
 
+        return {
+            "data": data,
+            "next": encodeCursor(data[-1]) if len(data) == limit else None
+        }
 
-@app.route(PREFIX + "/getInfo/", methods = ["GET"])
-def getInfo():
-    db = DBCommands(DB_PATH = "./data.db")
-    labID = str(request.args.get("labID"))
-    date = datetime.strptime(str(request.args.get("date")), "%Y-%m-%d").strftime("%Y-%m-%d")
-    numGen = int(request.args.get("numGen"))
-    data = db.select(labID = labID, date = date, numGen = numGen)
-    db.close()
+    # 指定がなければ従来通り全件を返すが、まとめて読み込まずに流す
+    if request.args.get("format") == "ndjson" or request.accept_mimetypes.best == "application/x-ndjson":
+        return Response(streamData(after, "ndjson"), mimetype = "application/x-ndjson")
+    return Response(streamData(after, "json"), mimetype = "application/json")
 
+
+def isFinished(date: str, numGen: int):
+    # そのコマが終わっていればTrue
+    now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    if date != today:
+        return date < today
+    if not 1 <= numGen <= len(FINISH_TIME):
+        return False
+    return now.strftime("%H:%M") >= FINISH_TIME[numGen - 1]
+
+
+def getInfoResponse(labID: str, date: str, numGen: int):
+    with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+        data = db.select(labID = labID, date = date, numGen = numGen)
+        since = db.rawSince()
+
+    # asgi.pyからはFlaskのアプリコンテキストの外で呼ばれるので、make_responseを使わずjsonifyと同じ形の本文を作る
     if data is not None:
-        return {
+        body = json.dumps({
             "labID": data[0],
             "date": data[1],
             "numGen": data[2],
@@ -76,10 +416,167 @@ def getInfo():
             "humidity": data[4],
             "pressure": data[5],
             "weather": data[6]
-        }
-    else: 
-        return "NODATA"
+        }, separators = (",", ":"), sort_keys = True) + "\n"
+        mimetype = "application/json"
+    else:
+        body = "NODATA"
+        mimetype = "text/html"
+
+    # 天気が埋まっていない、またはまだ終わっていないコマは変わりうる
+    final = data is not None and data[6] is not None and isFinished(date, numGen)
+    if since is not None and date < since:
+        maxAge = FROZEN_MAX_AGE
+    elif final:
+        maxAge = PAST_MAX_AGE
+    else:
+        maxAge = TODAY_MAX_AGE
+    body = body.encode()
+    return {
+        "body": body,
+        "mimetype": mimetype,
+        "etag": hashlib.sha256(body).hexdigest(),
+        "maxAge": maxAge
+    }
+
+
+def cachedInfo(labID: str, date: str, numGen: int):
+    key = (labID, date, numGen)
+    cached = responseCache.get(key)
+    if cached is None:
+        cached = getInfoResponse(labID = labID, date = date, numGen = numGen)
+        responseCache.put(key, cached, ttl = min(cached["maxAge"], RESPONSE_CACHE_TTL))
+    return cached
+
+
+@app.route(PREFIX + "/getInfo/", methods = ["GET"])
+def getInfo():
+    labID = str(request.args.get("labID"))
+    date = datetime.strptime(str(request.args.get("date")), "%Y-%m-%d").strftime("%Y-%m-%d")
+    numGen = int(request.args.get("numGen"))
+
+    cached = cachedInfo(labID = labID, date = date, numGen = numGen)
+
+    response = Response(cached["body"], mimetype = cached["mimetype"])
+    response.set_etag(cached["etag"])
+    response.cache_control.public = True
+    response.cache_control.max_age = cached["maxAge"]
+    # If-None-Matchが一致すれば304を返す
+    return response.make_conditional(request)
+
+
+@app.route(PREFIX + "/getRange/", methods = ["GET"])
+def getRange():
+    labID = str(request.args.get("labID"))
+    try:
+        dateFrom = datetime.strptime(str(request.args.get("from")), "%Y-%m-%d").strftime("%Y-%m-%d")
+        dateTo = datetime.strptime(str(request.args.get("to")), "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return {"error": "from and to must be yyyy-mm-dd"}, 400
+
+    # resolution=sampleなら高頻度の測定値(stepを指定するとstep秒ごとの平均)を返す
+    resolution = request.args.get("resolution", "period")
+    if resolution not in ("period", "sample"):
+        return {"error": "resolution must be period or sample"}, 400
+    if resolution == "sample":
+        try:
+            step = int(request.args["step"]) if "step" in request.args else None
+        except ValueError:
+            step = 0
+        if step is not None and step <= 0:
+            return {"error": "step must be a positive integer"}, 400
+        start = int(datetime.strptime(dateFrom, "%Y-%m-%d").timestamp())
+        end = int((datetime.strptime(dateTo, "%Y-%m-%d") + timedelta(days = 1)).timestamp())
+        with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+            data = db.selectSamples(labID = labID, start = start, end = end, step = step)
+        return jsonify([
+            {
+                "ts": datum[0],
+                "time": datetime.fromtimestamp(datum[0]).isoformat(),
+                "temperature": datum[1],
+                "humidity": datum[2],
+                "pressure": datum[3]
+            } for datum in data
+        ])
+
+    groupBy = request.args.get("groupBy")
+    if groupBy is not None and groupBy not in DBCommands.BUCKETS:
+        return {"error": f"groupBy must be one of {', '.join(DBCommands.BUCKETS)}"}, 400
+
+    with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+        if groupBy is None:
+            data = db.selectRange(labID = labID, dateFrom = dateFrom, dateTo = dateTo)
+        else:
+            data = db.aggregateRange(labID = labID, dateFrom = dateFrom, dateTo = dateTo, groupBy = groupBy)
+
+    if groupBy is None:
+        return jsonify([
+            {
+                "labID": datum[0],
+                "date": datum[1],
+                "numGen": datum[2],
+                "temperature": datum[3],
+                "humidity": datum[4],
+                "pressure": datum[5],
+                "weather": datum[6]
+            } for datum in data
+        ])
+
+    return jsonify([
+        {
+            groupBy: datum[0],
+            "count": datum[1],
+            "temperature": {"min": datum[2], "max": datum[3], "avg": datum[4]},
+            "humidity": {"min": datum[5], "max": datum[6], "avg": datum[7]},
+            "pressure": {"min": datum[8], "max": datum[9], "avg": datum[10]}
+        } for datum in data
+    ])
+
+
+@app.route(PREFIX + "/getStats/", methods = ["GET"])
+def getStats():
+    # term(例: 2023-1)を指定するとその学期のコマごと、なければfrom~toの日ごと(groupBy=weekなら週ごと)の集計を返す
+    # 間引きの後、古い期間は週ごとの集計しか残らない
+    labID = str(request.args.get("labID"))
+    term = request.args.get("term")
+    if term is not None:
+        try:
+            rollup.termRange(term)
+        except ValueError:
+            return {"error": "term must be like 2023-1"}, 400
+        with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+            data = [dict(rollup.summarize(datum, 3), numGen = datum[2]) for datum in db.periodStats(labID = labID, term = term)]
+    else:
+        try:
+            dateFrom = datetime.strptime(str(request.args.get("from")), "%Y-%m-%d").strftime("%Y-%m-%d")
+            dateTo = datetime.strptime(str(request.args.get("to")), "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            return {"error": "from and to must be yyyy-mm-dd"}, 400
+        with DBCommands(DB_PATH = DB_PATH, pool = pool) as db:
+            if request.args.get("groupBy") == "week":
+                data = [dict(rollup.summarize(datum, 2), week = datum[1]) for datum in db.weeklyStats(labID = labID, dateFrom = dateFrom, dateTo = dateTo)]
+            else:
+                data = [dict(rollup.summarize(datum, 2), date = datum[1]) for datum in db.dailyStats(labID = labID, dateFrom = dateFrom, dateTo = dateTo)]
+
+    return jsonify(data)
+
+
+@app.route(PREFIX + "/export/", methods = ["GET"])
+def export():
+    # ?labID=&from=&to=&format=csv|columnar 、gzipで圧縮して流す
+    format = request.args.get("format", "csv")
+    if format not in exportData.FORMATS:
+        return {"error": f"format must be one of {', '.join(exportData.FORMATS)}"}, 400
+    try:
+        dateFrom = request.args.get("from") and datetime.strptime(request.args["from"], "%Y-%m-%d").strftime("%Y-%m-%d")
+        dateTo = request.args.get("to") and datetime.strptime(request.args["to"], "%Y-%m-%d").strftime("%Y-%m-%d")
+    except ValueError:
+        return {"error": "from and to must be yyyy-mm-dd"}, 400
+    labID = request.args.get("labID")
+
+    rows = pagedRows(labID = labID, dateFrom = dateFrom or None, dateTo = dateTo or None)
+    mimetype, extension = exportData.FORMATS[format]
+    return Response(exportData.export(rows, format), mimetype = mimetype, headers = {"Content-Disposition": f"attachment; filename=wethap.{extension}"})
 
 
 if __name__ == "__main__":
-    app.run(port = 8000)
+    app.run(port = PORT)
@@ -0,0 +1,180 @@
+import bisect
+import functools
+import threading
+import time
+
+# Prometheusのテキスト形式で出力する簡易メトリクス
+# 記録はロック1回と加算だけなので常時有効にしておける
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def labelText(names, values, extra = ""):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{labelText(self.labels, labels)} {value}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, function):
+        # 出力のたびにfunctionを呼んで値を読む
+        self.name = name
+        self.help = help
+        self.function = function
+
+    def render(self):
+        try:
+            value = self.function()
+        except Exception:
+            value = float("nan")
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        # Noneはまだ値がない(天気を一度も取得していないなど)ので、サンプルを出さない
+        if value is not None:
+            lines.append(f"{self.name} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels = (), buckets = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self.lock = threading.Lock()
+        # ラベルごとに[各バケットの件数..., 合計, 件数]
+        self.values = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def time(self, *labels):
+        return Timer(self, labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            values = sorted((labels, list(counts)) for labels, counts in self.values.items())
+        for labels, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                le = labelText(self.labels, labels, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            le = labelText(self.labels, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {counts[-1]}")
+            lines.append(f"{self.name}_sum{labelText(self.labels, labels)} {counts[-2]}")
+            lines.append(f"{self.name}_count{labelText(self.labels, labels)} {counts[-1]}")
+        return lines
+
+
+class Timer:
+    def __init__(self, histogram: Histogram, labels: tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+
+REGISTRY = {}
+REGISTRY_LOCK = threading.Lock()
+
+def register(metric):
+    with REGISTRY_LOCK:
+        # 同じ名前は最初に登録したものを使う(モジュールの再読み込み対策)
+        return REGISTRY.setdefault(metric.name, metric)
+
+
+def counter(name: str, help: str, labels = ()):
+    return register(Counter(name, help, labels))
+
+
+def histogram(name: str, help: str, labels = (), buckets = DEFAULT_BUCKETS):
+    return register(Histogram(name, help, labels, buckets))
+
+
+def gauge(name: str, help: str, function):
+    with REGISTRY_LOCK:
+        # 関数は後から差し替えられるように上書きする
+        REGISTRY[name] = Gauge(name, help, function)
+        return REGISTRY[name]
+
+
+def render():
+    with REGISTRY_LOCK:
+        metrics = list(REGISTRY.values())
+    lines = []
+    for metric in metrics:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
+
+
+def instrument(cls, histogram: Histogram, names):
+    # クラスのメソッドを、メソッド名をラベルにした実行時間の計測つきに置き換える
+    for name in names:
+        method = getattr(cls, name)
+
+        def wrap(method, name):
+            @functools.wraps(method)
+            def timed(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start, name)
+            return timed
+
+        setattr(cls, name, wrap(method, name))
+
+
+def track(function, histogram: Histogram, failures: Counter):
+    # 関数の実行時間と失敗回数を記録する
+    @functools.wraps(function)
+    def tracked(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except Exception:
+            failures.inc()
+            raise
+        finally:
+            histogram.observe(time.perf_counter() - start)
+    return tracked
@@ -0,0 +1,58 @@
+import functools
+from datetime import datetime, timedelta
+
+
+@functools.lru_cache(maxsize = 64)
+def windows(
+    date: str,
+    finishTimes: tuple,
+    length: int
+):
+    """その日の各コマの時間帯を返す
+    Args:
+        date (str): 日付(yyyy-mm-dd)
+        finishTimes (tuple[str]): 各コマの終了時刻("09:25"など)
+        length (int): 1コマの長さ(分)
+    Returns:
+        tuple: (numGen, 開始, 終了)のタプル、時刻はサーバーのローカル時刻でのUNIX時間
+            開始は含まず終了は含む
+    """
+    day = datetime.strptime(date, "%Y-%m-%d")
+    result = []
+    for numGen, finish in enumerate(finishTimes, 1):
+        hour, minute = map(int, finish.split(":"))
+        end = day.replace(hour = hour, minute = minute)
+        result.append((numGen, int((end - timedelta(minutes = length)).timestamp()), int(end.timestamp())))
+    return tuple(result)
+
+
+def windowOf(
+    ts: int,
+    finishTimes: tuple,
+    length: int
+):
+    # tsを含むコマの(date, numGen, 開始, 終了)、授業時間外ならNone
+    date = datetime.fromtimestamp(ts).strftime("%Y-%m-%d")
+    for numGen, start, end in windows(date, finishTimes, length):
+        if start < ts <= end:
+            return (date, numGen, start, end)
+    return None
+
+
+def windowsEnding(
+    since: int,
+    until: int,
+    finishTimes: tuple,
+    length: int
+):
+    # 終了時刻がsinceより後、until以前のコマ
+    day = datetime.fromtimestamp(since).date()
+    last = datetime.fromtimestamp(until).date()
+    result = []
+    while day <= last:
+        date = day.strftime("%Y-%m-%d")
+        for numGen, start, end in windows(date, finishTimes, length):
+            if since < end <= until:
+                result.append((date, numGen, start, end))
+        day += timedelta(days = 1)
+    return result
@@ -0,0 +1,54 @@
+import collections
+import threading
+import time
+
+
+class ResponseCache:
+    def __init__(self, maxSize: int = 1024):
+        """有効期限つきのLRUキャッシュ
+        Args:
+            maxSize (int): 保持する最大件数、超えると最も古く使われたものから捨てる
+        """
+        self.maxSize = maxSize
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.counters["misses"] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+
+
+    def put(self, key, value, ttl: float):
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxSize:
+                self.entries.popitem(last = False)
+                self.counters["evictions"] += 1
+
+
+    def discard(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["size"] = len(self.entries)
+        return stats
@@ -0,0 +1,218 @@
+# 古いデータの間引き
+#   高頻度の測定値(samples) -> sampleDays日より前は消す(samplesから作ったコマごとの行は残る)
+#   生データ(readings) -> rawDays日より前は消す(日ごとの集計daily_statsは残る)
+#   日ごとの集計 -> dailyDays日より前は週ごとの集計weekly_statsに畳む
+#   週ごとの集計 -> weeklyDays日より前は消す(Noneなら残し続ける)
+# 消すのは少しずつ、1回ずつcommitしながら行うので、その間も書き込みを止めない
+#
+# 消したデータは戻せないので、動かす前に必ずバックアップを取ること
+#   sqlite3 data.db ".backup data.backup.db"
+# APIサーバー(main.py)ではWETHAP_RETENTION=1のときだけ、起動からinterval秒ごとに動く(既定では動かない)
+# 手動で1回だけ行う場合は
+#   python retention.py --db ./data.db --raw 90 --daily 365
+import argparse
+import sqlite3
+import threading
+import time
+from datetime import date as Date, datetime, timedelta
+import metrics
+import rollup
+from DBManage import DBCommands
+
+DELETED_ROWS = metrics.counter("wethap_retention_deleted_rows_total", "Rows removed by the retention job", ("table",))
+RUN_SECONDS = metrics.histogram("wethap_retention_run_seconds", "Time to run the retention job", buckets = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0))
+
+
+class RetentionPolicy:
+    def __init__(
+        self,
+        rawDays: int = 90,
+        dailyDays: int = 365,
+        weeklyDays: int = None,
+        sampleDays: int = 30
+    ):
+        """どこまで残すか
+        Args:
+            rawDays (int): 生データを残す日数
+            dailyDays (int): 日ごとの集計を残す日数(rawDays以上)
+            weeklyDays (int): 週ごとの集計を残す日数(Noneなら消さない)
+            sampleDays (int): 高頻度の測定値(samples)を残す日数
+        """
+        if dailyDays < rawDays:
+            raise ValueError("dailyDays must be >= rawDays")
+        if weeklyDays is not None and weeklyDays < dailyDays:
+            raise ValueError("weeklyDays must be >= dailyDays")
+        self.rawDays = rawDays
+        self.dailyDays = dailyDays
+        self.weeklyDays = weeklyDays
+        self.sampleDays = sampleDays
+
+
+    def cutoffs(self, today: str):
+        """todayの時点で消す(畳む)境目の日付、この日付より前が対象
+        生データの境目は学期の初日まで戻す
+        (学期ごとの集計period_statsは上書きのたびに生データから計算し直すので、学期の途中までは消さない)
+        """
+        today = Date.fromisoformat(today)
+        raw = rollup.termRange(rollup.termOf((today - timedelta(days = self.rawDays)).isoformat()))[0]
+        daily = min((today - timedelta(days = self.dailyDays)).isoformat(), raw)
+        weekly = None
+        if self.weeklyDays is not None:
+            weekly = (today - timedelta(days = self.weeklyDays)).isoformat()
+        samples = datetime.combine(today - timedelta(days = self.sampleDays), datetime.min.time())
+        return {"samples": int(samples.timestamp()), "raw": raw, "daily": daily, "weekly": weekly}
+
+
+class RetentionJob:
+    def __init__(
+        self,
+        DB_PATH: str,
+        policy: RetentionPolicy,
+        pool = None,
+        batchSize: int = 2000,
+        pause: float = 0.05,
+        vacuumPages: int = 256,
+        interval: float = 60 * 60 * 24
+    ):
+        """policyに従って古いデータを間引くジョブ
+        Args:
+            DB_PATH (str): DBファイルのパス
+            policy (RetentionPolicy): 残す期間
+            pool (ConnectionPool): 使うコネクションプール
+            batchSize (int): 1トランザクションで消す行数
+            pause (float): トランザクションの間に空ける秒数(その間に書き込みが入れる)
+            vacuumPages (int): 1回のincremental_vacuumで返すページ数
+            interval (float): startで動かしたときの実行間隔(秒)
+        """
+        self.DB_PATH = DB_PATH
+        self.policy = policy
+        self.pool = pool
+        self.batchSize = batchSize
+        self.pause = pause
+        self.vacuumPages = vacuumPages
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = None
+        self.lastRun = None
+
+
+    def open(self):
+        return DBCommands(DB_PATH = self.DB_PATH, pool = self.pool)
+
+
+    def start(self):
+        self.thread = threading.Thread(target = self.run, name = "retention", daemon = True)
+        self.thread.start()
+
+
+    def stop(self, timeout: float = 10.0):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+
+    def run(self):
+        # 起動した直後には消さず、interval秒ごとに行う
+        while not self.stopping.wait(self.interval):
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"retention error: {e}")
+
+
+    def batches(self, step, table: str):
+        # stepを消すものがなくなるまで繰り返す、1回ごとにcommitする
+        total = 0
+        while not self.stopping.is_set():
+            db = self.open()
+            try:
+                if db.connection.in_transaction:
+                    db.connection.commit()
+                db.cursor.execute("BEGIN IMMEDIATE")
+                count = step(db)
+            except BaseException:
+                db.connection.rollback()
+                db.close()
+                raise
+            db.close()
+            total += count
+            DELETED_ROWS.inc(table, amount = count)
+            if count < self.batchSize:
+                break
+            time.sleep(self.pause)
+        return total
+
+
+    def compact(self, today: str = None):
+        """1回分の間引きを行う
+        Args:
+            today (str): 基準の日付(省略時は今日)
+        Returns:
+            dict: 境目の日付と、テーブルごとに消した(畳んだ)行数
+        """
+        start = time.perf_counter()
+        cutoffs = self.policy.cutoffs(today or Date.today().isoformat())
+
+        # 先に境目を記録しておくと、途中で止まってもrebuildが消した範囲を作り直さない
+        with self.open() as db:
+            db.setRetentionCutoff("raw", cutoffs["raw"])
+
+        result = {"cutoffs": cutoffs}
+        result["samples"] = self.batches(lambda db: db.deleteSamplesBefore(cutoffs["samples"], self.batchSize), "samples")
+        result["readings"] = self.batches(lambda db: db.deleteReadingsBefore(cutoffs["raw"], self.batchSize), "readings")
+        result["daily_stats"] = self.batches(lambda db: db.foldDailyStats(cutoffs["daily"], self.batchSize), "daily_stats")
+        if cutoffs["weekly"] is not None:
+            result["weekly_stats"] = self.batches(lambda db: db.deleteWeeklyStatsBefore(cutoffs["weekly"], self.batchSize), "weekly_stats")
+
+        # 空いたページを少しずつOSに返す
+        vacuumed = 0
+        while not self.stopping.is_set():
+            with self.open() as db:
+                pages = db.incrementalVacuum(self.vacuumPages)
+            vacuumed += pages
+            if pages < self.vacuumPages:
+                break
+            time.sleep(self.pause)
+        result["vacuumedPages"] = vacuumed
+
+        RUN_SECONDS.observe(time.perf_counter() - start)
+        self.lastRun = dict(result, finishedAt = time.time())
+        return result
+
+
+def vacuum(DB_PATH: str):
+    # auto_vacuumをINCREMENTALにしてDB全体を作り直す(DB全体をロックするのでCLIからだけ使う)
+    # 以降はcompactのたびにincremental_vacuumで空きページが返される
+    connection = sqlite3.connect(DB_PATH, isolation_level = None)
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    connection.execute("VACUUM")
+    connection.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "古いデータを間引く")
+    parser.add_argument("--db", default = "./data.db")
+    parser.add_argument("--samples", type = int, default = 30, help = "高頻度の測定値を残す日数")
+    parser.add_argument("--raw", type = int, default = 90, help = "生データを残す日数")
+    parser.add_argument("--daily", type = int, default = 365, help = "日ごとの集計を残す日数")
+    parser.add_argument("--weekly", type = int, help = "週ごとの集計を残す日数(省略時は消さない)")
+    parser.add_argument("--today", help = "基準の日付(yyyy-mm-dd、省略時は今日)")
+    parser.add_argument("--batch", type = int, default = 2000)
+    parser.add_argument("--vacuum", action = "store_true", help = "最後にVACUUMしてauto_vacuumをINCREMENTALにする")
+    args = parser.parse_args()
+
+    db = DBCommands(DB_PATH = args.db)
+    db.createDB()
+    db.close()
+
+    job = RetentionJob(
+        DB_PATH = args.db,
+        policy = RetentionPolicy(rawDays = args.raw, dailyDays = args.daily, weeklyDays = args.weekly, sampleDays = args.samples),
+        batchSize = args.batch,
+        pause = 0)
+    start = time.perf_counter()
+    print(job.compact(today = args.today))
+    if args.vacuum:
+        vacuum(args.db)
+    print(f"done in {time.perf_counter() - start:.2f} sec")
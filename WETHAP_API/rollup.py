@@ -0,0 +1,213 @@
+import compactStore
+import functools
+import math
+import sqlite3
+import sys
+from datetime import date as Date
+
+MEASUREMENTS = ("temperature", "humidity", "pressure")
+
+# 集計表とそのキー、集計対象の列はMEASUREMENTSごとに Count, Sum, SumSq, Min, Max を持つ
+TABLES = {
+    "daily_stats": ("labID", "date"),
+    "period_stats": ("labID", "term", "numGen"),
+}
+
+COLUMNS = [f"{m}{suffix}" for m in MEASUREMENTS for suffix in ("Count", "Sum", "SumSq", "Min", "Max")]
+
+
+def termOf(date: str):
+    # 4月~9月を前期(1)、10月~翌3月を後期(2)とし、年度をつけて"2023-1"のように表す
+    year, month = int(date[:4]), int(date[5:7])
+    if month >= 4:
+        return f"{year}-{1 if month <= 9 else 2}"
+    return f"{year - 1}-2"
+
+
+def termRange(term: str):
+    year, half = map(int, term.split("-"))
+    if half == 1:
+        return (f"{year}-04-01", f"{year}-09-30")
+    return (f"{year}-10-01", Date(year + 1, 3, 31).strftime("%Y-%m-%d"))
+
+
+def measure(row):
+    # 気圧の-1はDHT11の「気圧センサーなし」なので値なしとして扱う(気温・湿度の-1は測定値)
+    values = []
+    for m, value in zip(MEASUREMENTS, row[3:6]):
+        values.append(None if value is None or m == "pressure" and value == -1 else float(value))
+    return values
+
+
+def createTables(cursor: sqlite3.Cursor):
+    columns = ", ".join(f"{column} {'INTEGER' if column.endswith('Count') else 'REAL'}" for column in COLUMNS)
+    for table, keys in TABLES.items():
+        cursor.execute(f"CREATE TABLE IF NOT EXISTS {table}({', '.join(keys)}, rows INTEGER NOT NULL, {columns}, PRIMARY KEY ({', '.join(keys)})) WITHOUT ROWID")
+
+
+def createRetentionTables(cursor: sqlite3.Cursor):
+    # retention.pyが日ごとの集計を畳む先と、生データを消した境目
+    columns = ", ".join(f"{column} {'INTEGER' if column.endswith('Count') else 'REAL'}" for column in COLUMNS)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS weekly_stats(labID, week, rows INTEGER NOT NULL, {columns}, PRIMARY KEY (labID, week)) WITHOUT ROWID")
+    cursor.execute("CREATE TABLE IF NOT EXISTS retention_state(name TEXT PRIMARY KEY, cutoff TEXT NOT NULL)")
+
+
+@functools.lru_cache(maxsize = None)
+def aggregateSelect(table: str, raw: bool = False):
+    # infosから集計表の1行分を作るSELECT
+    # rawならinfosビューを通さずreadingsを読む(主キー(lab, day)で絞れるのでrecomputeで使う、readingsができた後のDB専用)
+    columns = []
+    for m in MEASUREMENTS:
+        value = f"readings.{m} / {float(compactStore.SCALE[m])}" if raw else m
+        if m == "pressure":
+            value = f"NULLIF({value}, -1)"
+        columns += [f"COUNT({value})", f"TOTAL({value})", f"TOTAL({value} * {value})", f"MIN({value})", f"MAX({value})"]
+    if raw:
+        date = "date(readings.day + 2440587.5)"
+        if table == "daily_stats":
+            select, groupBy = f"labs.labID, {date}", "readings.lab, readings.day"
+        else:
+            select, groupBy = f"labs.labID, termOf({date}), readings.numGen", "readings.lab, readings.numGen"
+        return f"SELECT {select}, COUNT(*), {', '.join(columns)} FROM readings JOIN labs ON labs.id = readings.lab", f"GROUP BY {groupBy}"
+    if table == "daily_stats":
+        select = "labID, date"
+    else:
+        select = "labID, termOf(date), numGen"
+    return f"SELECT {select}, COUNT(*), {', '.join(columns)} FROM infos", f"GROUP BY {select}"
+
+
+def rawSince(cursor: sqlite3.Cursor):
+    # retention.pyが生データを消した境目(学期の初日)、消していなければNone
+    if cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'retention_state'").fetchone() is None:
+        return None
+    row = cursor.execute("SELECT cutoff FROM retention_state WHERE name = 'raw'").fetchone()
+    return row[0] if row else None
+
+
+def rebuild(cursor: sqlite3.Cursor, since: str = None):
+    """生データから集計表を作り直す
+    Args:
+        cursor (sqlite3.Cursor): カーソル
+        since (str): この日付(学期の初日)以降だけ作り直す、生データを消した後はrawSinceを渡す
+    """
+    cursor.connection.create_function("termOf", 1, termOf, deterministic = True)
+    createTables(cursor)
+    for table in TABLES:
+        select, groupBy = aggregateSelect(table)
+        if since is None:
+            cursor.execute(f"DELETE FROM {table}")
+            cursor.execute(f"INSERT INTO {table} {select} {groupBy}")
+            continue
+        if table == "daily_stats":
+            cursor.execute("DELETE FROM daily_stats WHERE date >= ?", (since,))
+        else:
+            cursor.execute("DELETE FROM period_stats WHERE term >= ?", (termOf(since),))
+        cursor.execute(f"INSERT INTO {table} {select} WHERE date >= ? {groupBy}", (since,))
+
+
+def recompute(cursor: sqlite3.Cursor, table: str, key: tuple):
+    # 上書きされた行を含む集計は、最小・最大を戻せないのでその1区間だけ生データから計算し直す
+    # readingsの主キー(lab, day, numGen)の範囲で読む
+    select, groupBy = aggregateSelect(table, raw = True)
+    if table == "daily_stats":
+        where, params = f"readings.lab = {compactStore.LAB_ID} and readings.day = ?", (key[0], compactStore.toDay(key[1]))
+    else:
+        start, end = termRange(key[1])
+        where, params = f"readings.lab = {compactStore.LAB_ID} and readings.day BETWEEN ? AND ? and readings.numGen = ?", (key[0], compactStore.toDay(start), compactStore.toDay(end), key[2])
+    cursor.connection.create_function("termOf", 1, termOf, deterministic = True)
+    cursor.execute(f"DELETE FROM {table} WHERE {' and '.join(f'{k} = ?' for k in TABLES[table])}", key)
+    cursor.execute(f"INSERT INTO {table} {select} WHERE {where} {groupBy}", params)
+
+
+def weekOf(date: str):
+    # 月曜始まりの週の初日を返すSQLの式
+    return f"date({date}, '-6 days', 'weekday 1')"
+
+
+def mergeColumns():
+    # 集計表の複数行を1行にまとめるSELECTの列(rowsから順に)
+    columns = ["SUM(rows)"]
+    for m in MEASUREMENTS:
+        columns += [f"SUM({m}Count)", f"TOTAL({m}Sum)", f"TOTAL({m}SumSq)", f"MIN({m}Min)", f"MAX({m}Max)"]
+    return ", ".join(columns)
+
+
+@functools.lru_cache(maxsize = None)
+def upsertSql(table: str, keys: tuple = None, select: str = None):
+    # 既にある行には足し合わせる、selectを渡すとVALUESの代わりにそのSELECTの結果を入れる
+    keys = keys or TABLES[table]
+    updates = ["rows = rows + excluded.rows"]
+    for m in MEASUREMENTS:
+        updates += [
+            f"{m}Count = {m}Count + excluded.{m}Count",
+            f"{m}Sum = {m}Sum + excluded.{m}Sum",
+            f"{m}SumSq = {m}SumSq + excluded.{m}SumSq",
+            # SQLiteのMIN(a, b)はどちらかがNULLだとNULLになるのでCOALESCEで補う
+            f"{m}Min = COALESCE(MIN({m}Min, excluded.{m}Min), {m}Min, excluded.{m}Min)",
+            f"{m}Max = COALESCE(MAX({m}Max, excluded.{m}Max), {m}Max, excluded.{m}Max)",
+        ]
+    if select is None:
+        select = f"VALUES({', '.join('?' * (len(keys) + 1 + len(COLUMNS)))})"
+    return f"INSERT INTO {table} {select} ON CONFLICT({', '.join(keys)}) DO UPDATE SET {', '.join(updates)}"
+
+
+def apply(cursor: sqlite3.Cursor, rows, replaced):
+    """挿入した行を集計表に反映する
+    Args:
+        cursor (sqlite3.Cursor): infosへの挿入と同じトランザクションのカーソル
+        rows (list[tuple]): 挿入したinfosの行
+        replaced (set[tuple]): 既存の行を上書きした(labID, date, numGen)
+    """
+    added = {"daily_stats": [], "period_stats": []}
+    dirty = {"daily_stats": set(), "period_stats": set()}
+    for row in rows:
+        labID, date, numGen = row[:3]
+        keys = {
+            "daily_stats": (labID, date),
+            "period_stats": (labID, termOf(date), numGen),
+        }
+        if (labID, date, numGen) in replaced:
+            for table, key in keys.items():
+                dirty[table].add(key)
+            continue
+
+        stats = []
+        for value in measure(row):
+            if value is None:
+                stats += [0, 0.0, 0.0, None, None]
+            else:
+                stats += [1, value, value * value, value, value]
+        for table, key in keys.items():
+            added[table].append((*key, 1, *stats))
+
+    for table in TABLES:
+        if added[table]:
+            cursor.executemany(upsertSql(table), added[table])
+        for key in dirty[table]:
+            recompute(cursor, table, key)
+
+
+def summarize(row, keyCount: int):
+    # 集計表の1行を平均・標準偏差つきの辞書にする
+    summary = {"rows": row[keyCount]}
+    for i, m in enumerate(MEASUREMENTS):
+        count, total, totalSq, minimum, maximum = row[keyCount + 1 + i * 5:keyCount + 6 + i * 5]
+        if count:
+            avg = total / count
+            std = math.sqrt(max(totalSq / count - avg * avg, 0.0))
+        else:
+            avg = std = None
+        summary[m] = {"count": count, "min": minimum, "max": maximum, "avg": avg, "std": std}
+    return summary
+
+
+if __name__ == "__main__":
+    # python rollup.py ./data.db で集計表を作り直す
+    DB_PATH = sys.argv[1] if len(sys.argv) > 1 else "./data.db"
+    connection = sqlite3.connect(DB_PATH)
+    cursor = connection.cursor()
+    rebuild(cursor, since = rawSince(cursor))
+    connection.commit()
+    for table in TABLES:
+        print(table, cursor.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0])
+    connection.close()
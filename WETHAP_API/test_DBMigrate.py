@@ -0,0 +1,84 @@
+# python -m unittest test_DBMigrate (WETHAP_APIで実行)
+# 重複のある最初期のinfosから、マイグレーション3(主キーへの作り直し)と8(readingsへの移行)を確かめる
+import contextlib
+import io
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from DBMigrate import LATEST_VERSION, currentVersion, migrate
+
+# (labID, date, numGen, temperature, humidity, pressure, weather)、rowid順
+LEGACY_ROWS = [
+    ("simo", "2023-5-1", 1, 21.5, 40.125, 1001.25, "晴れ"),
+    ("simo", "2023-05-01", 1, 99.0, 99.0, 999.0, "雨"),   # 日付の書き方違いの重複
+    ("simo", "2023-05-01", 2, 22, 41, -1, None),
+    ("simo", "2023-05-01", 2, 23, 42, -1, "曇り"),         # 同じキーの重複
+    (None, "2023-05-01", 1, 20.0, 40.0, 1000.0, "晴れ"),   # キーが欠けた行
+    ("T4教室", "2023-05-24", 13, 26.44, 50.0, 1010.0, "晴れ"),
+    ("T4教室", "2023-05-24", 13, 28.56, 51.0, 1011.0, "晴れ"),
+    ("T4教室", "2023-05-24", 13, 27.0, 52.0, 1012.0, "晴れ"),
+]
+KEPT = [
+    ("T4教室", "2023-05-24", 13, 26.44, 50.0, 1010.0, "晴れ"),
+    ("simo", "2023-05-01", 1, 21.5, 40.125, 1001.25, "晴れ"),
+    ("simo", "2023-05-01", 2, 22.0, 41.0, -1.0, None),
+]
+INFOS = "SELECT labID, date, numGen, temperature, humidity, pressure, weather FROM infos ORDER BY labID, date, numGen"
+
+
+class MigrateTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.connection = sqlite3.connect(os.path.join(self.tmp, "data.db"))
+        self.migrate(target = 2)
+        self.connection.executemany("INSERT INTO infos VALUES(?, ?, ?, ?, ?, ?, ?)", LEGACY_ROWS)
+        self.connection.commit()
+
+    def tearDown(self):
+        self.connection.close()
+        shutil.rmtree(self.tmp, ignore_errors = True)
+
+    def migrate(self, target: int = None):
+        with contextlib.redirect_stdout(io.StringIO()):
+            return migrate(self.connection, target = target)
+
+    def test_cluster_keeps_first_row_and_archives_the_rest(self):
+        self.assertEqual(self.migrate(target = 3), [3])
+        self.assertEqual(self.connection.execute(INFOS).fetchall(), KEPT)
+        archived = self.connection.execute("SELECT sourceRowid, labID, date, numGen, temperature FROM infos_duplicates ORDER BY sourceRowid").fetchall()
+        self.assertEqual(archived, [
+            (2, "simo", "2023-05-01", 1, 99.0),
+            (4, "simo", "2023-05-01", 2, 23),
+            (5, None, "2023-05-01", 1, 20.0),
+            (7, "T4教室", "2023-05-24", 13, 28.56),
+            (8, "T4教室", "2023-05-24", 13, 27.0),
+        ])
+        # 残った行と移した行で元の行がすべて揃う
+        self.assertEqual(len(KEPT) + len(archived), len(LEGACY_ROWS))
+
+    def test_compact_keeps_rows(self):
+        self.migrate(target = 7)
+        before = self.connection.execute(INFOS).fetchall()
+        stats = self.connection.execute("SELECT * FROM daily_stats ORDER BY labID, date").fetchall()
+
+        self.assertEqual(self.migrate(), list(range(8, LATEST_VERSION + 1)))
+        self.assertEqual(currentVersion(self.connection), LATEST_VERSION)
+        # infosはreadingsのビューになり、同じ行を返す
+        kind = self.connection.execute("SELECT type FROM sqlite_master WHERE name = 'infos'").fetchone()[0]
+        self.assertEqual(kind, "view")
+        self.assertEqual(self.connection.execute(INFOS).fetchall(), before)
+        self.assertEqual(before, KEPT)
+        self.assertEqual(self.connection.execute("SELECT COUNT(*) FROM readings").fetchone()[0], len(KEPT))
+        self.assertEqual(self.connection.execute("SELECT COUNT(*) FROM infos_duplicates").fetchone()[0], 5)
+        # 気温・湿度の-1を含まないデータなので、集計の作り直し(11)の前後で変わらない
+        self.assertEqual(self.connection.execute("SELECT * FROM daily_stats ORDER BY labID, date").fetchall(), stats)
+
+    def test_migrate_twice_does_nothing(self):
+        self.migrate()
+        self.assertEqual(self.migrate(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+# python -m unittest test_asgi (WETHAP_APIで実行、starletteとhttpxが必要)
+# data.dbのコピーに対してASGI版の/getInfo/を叩く
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+PREFIX = "/WETHAP/api"
+KEY = ("テスト研究室", "2000-01-01", 1)
+
+
+def setUpModule():
+    global tmp, asgi, client
+    tmp = tempfile.mkdtemp()
+    path = os.path.join(tmp, "data.db")
+    shutil.copyfile(os.path.join(os.path.dirname(os.path.abspath(__file__)), "data.db"), path)
+    # mainはimport時にWETHAP_DB_PATHのDBを開くので先に差し替える
+    os.environ["WETHAP_DB_PATH"] = path
+    from starlette.testclient import TestClient
+    asgi = importlib.import_module("asgi")
+    client = TestClient(asgi.app)
+
+    with asgi.DBCommands(DB_PATH = path, pool = asgi.main.pool) as db:
+        db.insert(*KEY, temperature = 21.5, humidity = 40.0, pressure = 1013.2, weather = "晴れ")
+
+
+def tearDownModule():
+    client.close()
+    shutil.rmtree(tmp, ignore_errors = True)
+
+
+class GetInfoTest(unittest.TestCase):
+    def setUp(self):
+        asgi.main.responseCache.discard(KEY)
+
+    def get(self, labID, date, numGen, headers = None):
+        return client.get(PREFIX + "/getInfo/", params = {"labID": labID, "date": date, "numGen": numGen}, headers = headers)
+
+    def test_cache_miss(self):
+        response = self.get(*KEY)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["content-type"].split(";")[0], "application/json")
+        self.assertEqual(json.loads(response.content), {
+            "labID": KEY[0], "date": KEY[1], "numGen": KEY[2],
+            "temperature": 21.5, "humidity": 40.0, "pressure": 1013.2, "weather": "晴れ"
+        })
+
+        # 2回目はキャッシュから同じETagで返り、If-None-Matchなら304
+        again = self.get(*KEY)
+        self.assertEqual(again.content, response.content)
+        self.assertEqual(again.headers["etag"], response.headers["etag"])
+        self.assertEqual(self.get(*KEY, headers = {"If-None-Match": response.headers["etag"]}).status_code, 304)
+
+    def test_cache_miss_nodata(self):
+        response = self.get(KEY[0], "1999-01-01", 1)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b"NODATA")
+
+    def test_bad_query(self):
+        self.assertEqual(self.get(KEY[0], "not-a-date", 1).status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
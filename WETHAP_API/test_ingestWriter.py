@@ -0,0 +1,54 @@
+# python -m unittest test_ingestWriter (WETHAP_APIで実行)
+# グループコミットで1つのリクエストが失敗しても、同じグループの他のリクエストはcommitされるか確かめる
+import os
+import shutil
+import tempfile
+import unittest
+from DBManage import DBCommands
+from ingestWriter import IngestWriter
+from weatherQueue import WeatherQueue
+
+TIMEOUT = 10
+
+
+class IngestWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "data.db")
+        with DBCommands(DB_PATH = self.path) as db:
+            db.createDB()
+        # ワーカーは動かさず、天気のジョブが積まれるかだけ見る
+        self.weatherQueue = WeatherQueue(DB_PATH = self.path, fetch = None)
+        # 3件が同じグループに入るよう、書き込みスレッドは全部積んでから動かす
+        self.writer = IngestWriter(DB_PATH = self.path, weatherQueue = self.weatherQueue, maxDelay = 0.5)
+
+    def tearDown(self):
+        self.writer.stop()
+        shutil.rmtree(self.tmp, ignore_errors = True)
+
+    def test_failed_request_does_not_fail_the_group(self):
+        good = self.writer.submit([("good", "2024-01-01", 1, 20.0, 50.0, 1000.0, None)], weatherKeys = [("good", "2024-01-01", 1)], sensors = {"good": "BME280"})
+        # 検証を通らない値を直接渡して、書き込みスレッドの中で失敗させる
+        bad = self.writer.submit([("bad", "2024-01-01", 1, float("nan"), 50.0, 1000.0, None)], weatherKeys = [("bad", "2024-01-01", 1)], sensors = {"bad": "DHT11"})
+        other = self.writer.submit([("good", "2024-01-01", 2, 21.0, 51.0, 1001.0, "晴れ")])
+        self.writer.start()
+
+        self.assertEqual(good.result(TIMEOUT), 1)
+        self.assertEqual(other.result(TIMEOUT), 1)
+        self.assertIsInstance(bad.exception(TIMEOUT), ValueError)
+
+        with DBCommands(DB_PATH = self.path) as db:
+            self.assertEqual(db.select(labID = "good", date = "2024-01-01", numGen = 1)[3], 20.0)
+            self.assertEqual(db.select(labID = "good", date = "2024-01-01", numGen = 2)[6], "晴れ")
+            # 失敗したリクエストの研究室・天気のジョブは残らない
+            self.assertFalse(db.isRegistered(labID = "bad"))
+            self.assertEqual([lab[:2] for lab in db.labInfos()], [("good", "BME280")])
+            self.assertEqual(db.countWeatherJobs()["pending"], 1)
+            self.assertEqual(len(db.dailyStats(labID = "bad", dateFrom = "2024-01-01", dateTo = "2024-01-01")), 0)
+
+        stats = self.writer.stats()
+        self.assertEqual((stats["commits"], stats["rows"], stats["errors"]), (1, 2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+# python -m unittest test_retention (WETHAP_APIで実行)
+# 一時DBに1年半分のデータを入れて間引き(retention.py)を確かめる
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import date as Date, timedelta
+import rollup
+from DBManage import DBCommands
+from retention import RetentionJob, RetentionPolicy
+
+LABS = ("lab1", "lab2")
+FIRST_DAY = Date(2023, 1, 2)
+DAYS = 540
+TODAY = "2024-06-30"
+
+
+def makeRows():
+    rows = []
+    for offset in range(DAYS):
+        date = (FIRST_DAY + timedelta(days = offset)).isoformat()
+        for i, labID in enumerate(LABS):
+            for numGen in (1, 2):
+                temperature = round(-5 + (offset * 7 + numGen * 3 + i) % 40 * 0.73, 2)
+                # lab2は気圧センサーなし(-1)
+                pressure = -1.0 if labID == "lab2" else round(990 + offset % 30 * 1.1, 2)
+                rows.append((labID, date, numGen, temperature, 40.0 + offset % 20, pressure, "晴れ"))
+    return rows
+
+
+def rounded(rows):
+    return [tuple(round(v, 6) if isinstance(v, float) else v for v in row) for row in rows]
+
+
+class RetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "data.db")
+        with DBCommands(DB_PATH = self.path) as db:
+            db.createDB()
+            db.insertMany(makeRows())
+        self.job = RetentionJob(DB_PATH = self.path, policy = RetentionPolicy(rawDays = 90, dailyDays = 180, sampleDays = 30), batchSize = 97, pause = 0)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors = True)
+
+    def weekly(self, labID: str):
+        with DBCommands(DB_PATH = self.path) as db:
+            return rounded(db.weeklyStats(labID = labID, dateFrom = "2022-12-26", dateTo = TODAY))
+
+    def totals(self):
+        # 日ごと・週ごとの集計を合わせた研究室ごとの行数と合計
+        connection = sqlite3.connect(self.path)
+        try:
+            return {
+                labID: rounded([connection.execute(
+                    f"SELECT {rollup.mergeColumns()} FROM (SELECT {', '.join(['rows', *rollup.COLUMNS])} FROM daily_stats WHERE labID = ? UNION ALL SELECT {', '.join(['rows', *rollup.COLUMNS])} FROM weekly_stats WHERE labID = ?)",
+                    (labID, labID)).fetchone()])[0]
+                for labID in LABS
+            }
+        finally:
+            connection.close()
+
+    def test_cutoffs(self):
+        cutoffs = RetentionPolicy(rawDays = 90, dailyDays = 180).cutoffs(TODAY)
+        # 90日前(2024-04-01)の学期の初日まで戻る
+        self.assertEqual(cutoffs["raw"], "2024-04-01")
+        self.assertEqual(cutoffs["daily"], "2024-01-02")
+        self.assertIsNone(cutoffs["weekly"])
+
+    def test_compact_keeps_totals(self):
+        weekly = {labID: self.weekly(labID) for labID in LABS}
+        totals = self.totals()
+        self.assertEqual(totals["lab1"][0], DAYS * 2)
+
+        result = self.job.compact(today = TODAY)
+        self.assertEqual(result["cutoffs"]["raw"], "2024-04-01")
+        self.assertGreater(result["readings"], 0)
+        self.assertGreater(result["daily_stats"], 0)
+
+        # 消したのは境目より前の生データだけ
+        with DBCommands(DB_PATH = self.path) as db:
+            self.assertIsNone(db.select(labID = "lab1", date = "2024-03-31", numGen = 1))
+            self.assertIsNotNone(db.select(labID = "lab1", date = "2024-04-01", numGen = 1))
+            db.cursor.execute("SELECT MIN(date) FROM daily_stats")
+            self.assertEqual(db.cursor.fetchone()[0], "2024-01-02")
+        # 畳んでも件数・合計・最小・最大は変わらない
+        self.assertEqual(self.totals(), totals)
+        for labID in LABS:
+            self.assertEqual(self.weekly(labID), weekly[labID])
+
+        # もう一度動かしても何も変わらない
+        again = self.job.compact(today = TODAY)
+        self.assertEqual((again["readings"], again["daily_stats"]), (0, 0))
+        self.assertEqual(self.totals(), totals)
+
+    def test_late_insert_before_cutoff_is_dropped(self):
+        self.job.compact(today = TODAY)
+        totals = self.totals()
+        with DBCommands(DB_PATH = self.path) as db:
+            self.assertEqual(db.insertMany([("lab1", "2023-06-01", 1, 99.0, 99.0, 999.0, "雨")]), 0)
+            self.assertEqual(db.insertMany([("lab1", "2023-06-01", 3, 20.0, 50.0, 1000.0, "雨"), ("lab1", "2024-06-01", 3, 20.0, 50.0, 1000.0, "雨")]), 1)
+            self.assertIsNone(db.select(labID = "lab1", date = "2023-06-01", numGen = 3))
+            self.assertIsNotNone(db.select(labID = "lab1", date = "2024-06-01", numGen = 3))
+        after = self.totals()
+        # 境目より後の1行だけが足される
+        self.assertEqual(after["lab2"], totals["lab2"])
+        self.assertEqual(after["lab1"][0], totals["lab1"][0] + 1)
+        self.assertAlmostEqual(after["lab1"][2], totals["lab1"][2] + 20.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# python -m unittest test_rollup (WETHAP_APIで実行)
+# insertManyのたびに足し込む集計(rollup.apply/recompute)が、生データからのrebuildと一致するか確かめる
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import unittest
+import rollup
+from DBManage import DBCommands
+
+
+def snapshot(connection: sqlite3.Connection):
+    return {
+        table: [
+            tuple(round(v, 6) if isinstance(v, float) else v for v in row)
+            for row in connection.execute(f"SELECT * FROM {table} ORDER BY {', '.join(keys)}").fetchall()
+        ]
+        for table, keys in rollup.TABLES.items()
+    }
+
+
+class RollupTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "data.db")
+        with DBCommands(DB_PATH = self.path) as db:
+            db.createDB()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp, ignore_errors = True)
+
+    def assertMatchesRebuild(self):
+        connection = sqlite3.connect(self.path)
+        try:
+            incremental = snapshot(connection)
+            rollup.rebuild(connection.cursor())
+            self.assertEqual(incremental, snapshot(connection))
+        finally:
+            connection.close()
+        return incremental
+
+    def test_apply_and_recompute_match_rebuild(self):
+        rng = random.Random(1)
+        keys = [(labID, f"2023-{month:02d}-{day:02d}", numGen) for labID in ("a", "b") for month in (3, 4, 9, 10) for day in (1, 15, 30) for numGen in (1, 2, 3)]
+
+        def row(key):
+            # -1の気温・湿度は測定値、-1の気圧とNoneは値なし
+            temperature = rng.choice([None, -1.0, round(rng.uniform(-10, 35), 2)])
+            humidity = rng.choice([-1.0, round(rng.uniform(0, 100), 3)])
+            pressure = rng.choice([None, -1.0, round(rng.uniform(980, 1030), 2)])
+            return (*key, temperature, humidity, pressure, rng.choice([None, "晴れ"]))
+
+        for _ in range(6):
+            # 新しい行、既にある行の上書き、同じ挿入の中での重複が混ざる
+            batch = [row(rng.choice(keys)) for _ in range(40)]
+            with DBCommands(DB_PATH = self.path) as db:
+                db.insertMany(batch)
+            stats = self.assertMatchesRebuild()
+        self.assertTrue(stats["daily_stats"] and stats["period_stats"])
+
+    def test_minus_one_counts_except_pressure(self):
+        with DBCommands(DB_PATH = self.path) as db:
+            db.insertMany([("a", "2023-05-01", 1, -1.0, -1.0, -1.0, None), ("a", "2023-05-01", 2, 3.0, 5.0, 1000.0, None)])
+            summary = rollup.summarize(db.dailyStats(labID = "a", dateFrom = "2023-05-01", dateTo = "2023-05-01")[0], 2)
+        self.assertEqual(summary["temperature"]["count"], 2)
+        self.assertEqual(summary["temperature"]["min"], -1.0)
+        self.assertEqual(summary["humidity"]["count"], 2)
+        self.assertEqual(summary["pressure"]["count"], 1)
+        self.assertEqual(summary["pressure"]["min"], 1000.0)
+
+    def test_overwrite_recomputes_min_max(self):
+        with DBCommands(DB_PATH = self.path) as db:
+            db.insertMany([("a", "2023-05-01", 1, 30.0, 50.0, 1000.0, None), ("a", "2023-05-01", 2, 20.0, 50.0, 1000.0, None)])
+        with DBCommands(DB_PATH = self.path) as db:
+            db.insertMany([("a", "2023-05-01", 1, 25.0, 50.0, 1000.0, None)])
+            summary = rollup.summarize(db.dailyStats(labID = "a", dateFrom = "2023-05-01", dateTo = "2023-05-01")[0], 2)
+        self.assertEqual(summary["rows"], 2)
+        self.assertEqual(summary["temperature"]["max"], 25.0)
+        self.assertAlmostEqual(summary["temperature"]["avg"], 22.5)
+        self.assertMatchesRebuild()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import threading
+import time
+from fetchWeather import fetchWeather
+
+
+class WeatherCache:
+    def __init__(
+        self,
+        fetch = fetchWeather,
+        ttl: float = 300.0,
+        staleTtl: float = 3600.0
+    ):
+        """fetchWeatherの結果をttl秒間使い回すキャッシュ
+        Args:
+            fetch (Callable[[], str]): 天気を取得する関数
+            ttl (float): 取得した天気を新しいとみなす秒数
+            staleTtl (float): 取得に失敗したとき、古い天気を代わりに返してよい秒数
+        """
+        self.fetch = fetch
+        self.ttl = ttl
+        self.staleTtl = staleTtl
+        self.lock = threading.Lock()
+        self.value = None
+        self.fetchedAt = None
+        self.inflight = None
+        self.counters = {"hits": 0, "misses": 0, "fetches": 0, "errors": 0, "stale": 0}
+
+
+    def age(self):
+        if self.fetchedAt is None:
+            return None
+        return time.monotonic() - self.fetchedAt
+
+
+    def get(self):
+        return self.getWithTime()[0]
+
+
+    def getWithTime(self):
+        # (天気, その天気を取得したUNIX時間)、キャッシュや取得失敗時の古い値ではその分だけ昔の時刻になる
+        with self.lock:
+            age = self.age()
+            if age is not None and age < self.ttl:
+                self.counters["hits"] += 1
+                return self.value, time.time() - age
+
+            self.counters["misses"] += 1
+            # 取得中の処理があればそれを待つ(同時に外れても取得は1回だけ)
+            if self.inflight is not None:
+                flight = self.inflight
+                leader = False
+            else:
+                flight = self.inflight = {"done": threading.Event(), "value": None, "fetchedAt": None, "error": None}
+                leader = True
+
+        if leader:
+            self.refresh(flight)
+        else:
+            flight["done"].wait()
+
+        if flight["error"] is None:
+            return flight["value"], flight["fetchedAt"]
+
+        with self.lock:
+            age = self.age()
+            if age is not None and age < self.staleTtl:
+                self.counters["stale"] += 1
+                return self.value, time.time() - age
+        raise flight["error"]
+
+
+    def refresh(self, flight: dict):
+        try:
+            value = self.fetch()
+        except Exception as e:
+            with self.lock:
+                self.counters["errors"] += 1
+            flight["error"] = e
+        else:
+            with self.lock:
+                self.counters["fetches"] += 1
+                self.value = value
+                self.fetchedAt = time.monotonic()
+            flight["value"] = value
+            flight["fetchedAt"] = time.time()
+        finally:
+            with self.lock:
+                self.inflight = None
+            flight["done"].set()
+
+
+    def invalidate(self):
+        with self.lock:
+            self.fetchedAt = None
+
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            stats["age"] = self.age()
+        return stats
+
+
+if __name__ == "__main__":
+    # ローカルのスタブページを相手に動作確認する
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class StubWeatherPage(BaseHTTPRequestHandler):
+        requested = 0
+
+        def do_GET(self):
+            StubWeatherPage.requested += 1
+            time.sleep(0.2)
+            body = '<ul class="weather-now__ul"><li>天気晴れ</li></ul>'.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubWeatherPage)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    url = f"http://127.0.0.1:{server.server_port}/"
+
+    cache = WeatherCache(fetch = lambda: fetchWeather(url), ttl = 60)
+    with ThreadPoolExecutor(max_workers = 20) as executor:
+        print(list(executor.map(lambda _: cache.get(), range(20))))
+    print(f"stub requested {StubWeatherPage.requested} time(s)")
+    print(cache.stats())
+    server.shutdown()
@@ -0,0 +1,187 @@
+import collections
+import threading
+import time
+from DBManage import DBCommands
+
+
+class WeatherQueue:
+    def __init__(
+        self,
+        DB_PATH: str,
+        fetch,
+        pool = None,
+        workers: int = 2,
+        maxAttempts: int = 5,
+        backoff: float = 10.0,
+        maxBackoff: float = 600.0,
+        lease: float = 60.0,
+        pollInterval: float = 5.0,
+        maxAge: float = 900.0
+    ):
+        """infosのweatherを後から埋めるワーカー
+        ジョブはweather_jobsテーブルに保存されるので、再起動しても残る
+        fetchは今(またはキャッシュした時点)の天気しか返さないので、
+        積んだときから天気の取得時刻がmaxAge秒より離れているジョブは天気をNULLのまま終える
+        Args:
+            DB_PATH (str): DBファイルのパス
+            fetch (Callable[[], tuple[str, float]]): 天気と、その天気を取得したUNIX時間を返す関数(WeatherCache.getWithTime)
+            pool (ConnectionPool): 使うコネクションプール
+            workers (int): ワーカースレッド数
+            maxAttempts (int): 諦めるまでの試行回数
+            backoff (float): 再試行までの待ち時間の初期値(失敗するごとに倍)
+            maxBackoff (float): 再試行までの待ち時間の上限
+            lease (float): 取り出したジョブを他のワーカーから隠しておく秒数
+            pollInterval (float): ジョブがないときに待つ秒数
+            maxAge (float): 積んだとき(createdAt)と天気の取得時刻の差がこの秒数以内なら、その時の天気とみなす
+        """
+        self.DB_PATH = DB_PATH
+        self.fetch = fetch
+        self.pool = pool
+        self.workers = workers
+        self.maxAttempts = maxAttempts
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self.lease = lease
+        self.pollInterval = pollInterval
+        self.maxAge = maxAge
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.latencies = collections.deque(maxlen = 1000)
+        self.counters = {"completed": 0, "retried": 0, "failed": 0, "expired": 0}
+
+
+    def open(self):
+        return DBCommands(DB_PATH = self.DB_PATH, pool = self.pool)
+
+
+    def enqueue(
+        self,
+        db: DBCommands,
+        labID: str,
+        date: str,
+        numGen: int
+    ):
+        # 行の挿入と同じトランザクションでジョブを積む
+        db.enqueueWeather(labID = labID, date = date, numGen = numGen, now = time.time())
+        self.wakeup.set()
+
+
+    def enqueueMany(
+        self,
+        db: DBCommands,
+        keys
+    ):
+        keys = list(keys)
+        if keys:
+            db.enqueueWeatherMany(keys = keys, now = time.time())
+            self.wakeup.set()
+
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target = self.run, name = f"weather-worker-{i}", daemon = True)
+            thread.start()
+            self.threads.append(thread)
+
+
+    def stop(self, timeout: float = 10.0):
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+
+    def run(self):
+        while not self.stopping.is_set():
+            try:
+                processed = self.processOne()
+            except Exception as e:
+                print(f"weather worker error: {e}")
+                processed = False
+            if not processed:
+                self.wakeup.wait(self.pollInterval)
+                self.wakeup.clear()
+
+
+    def processOne(self):
+        db = self.open()
+        try:
+            job = db.claimWeatherJob(now = time.time(), lease = self.lease)
+        finally:
+            db.close()
+        if job is None:
+            return False
+
+        labID, date, numGen, attempts, createdAt = job
+        try:
+            weather, fetchedAt = self.fetch()
+            # キャッシュの古い値(取得失敗時のものも含む)など、積んだときから離れた時刻の天気は入れない
+            if abs(fetchedAt - createdAt) > self.maxAge:
+                raise ValueError(f"weather fetched {fetchedAt - createdAt:.0f} seconds from the job")
+        except Exception as e:
+            # まだ積んでからmaxAge秒経っていなければ取り直す、経っていればこの先もその時の天気は取れないので諦める
+            if time.time() - createdAt <= self.maxAge:
+                self.fail(labID, date, numGen, attempts + 1, e)
+                return True
+            weather = None
+        finishedAt = time.time()
+
+        db = self.open()
+        try:
+            db.completeWeatherJob(labID = labID, date = date, numGen = numGen, weather = weather)
+        finally:
+            db.close()
+        with self.lock:
+            if weather is None:
+                self.counters["expired"] += 1
+            else:
+                self.counters["completed"] += 1
+                self.latencies.append(finishedAt - createdAt)
+        return True
+
+
+    def fail(
+        self,
+        labID: str,
+        date: str,
+        numGen: int,
+        attempts: int,
+        error: Exception
+    ):
+        if attempts >= self.maxAttempts:
+            nextAttemptAt = None
+            counter = "failed"
+        else:
+            nextAttemptAt = time.time() + min(self.backoff * 2 ** (attempts - 1), self.maxBackoff)
+            counter = "retried"
+
+        db = self.open()
+        try:
+            db.retryWeatherJob(labID = labID, date = date, numGen = numGen, nextAttemptAt = nextAttemptAt, error = repr(error))
+        finally:
+            db.close()
+        with self.lock:
+            self.counters[counter] += 1
+
+
+    def stats(self):
+        db = self.open()
+        try:
+            stats = db.countWeatherJobs()
+        finally:
+            db.close()
+
+        with self.lock:
+            stats.update(self.counters)
+            latencies = sorted(self.latencies)
+        if latencies:
+            stats["latency"] = {
+                "avg": sum(latencies) / len(latencies),
+                "p50": latencies[len(latencies) // 2],
+                "p95": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                "max": latencies[-1]
+            }
+        return stats